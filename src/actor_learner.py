@@ -0,0 +1,321 @@
+import contextlib
+import multiprocessing as mp
+import queue
+import time
+
+import jax
+import numpy as np
+from open_spiel.python.algorithms.rnad import rnad
+
+from checkpoint_writer import snapshot_agent
+from policy_checkpoint import sample_actions
+from vector_env import VectorLiarsPoker
+
+
+def _untimed(phase):
+    return contextlib.nullcontext()
+
+
+def learner_update(agent, timestep, profiler=None):
+    """The learner half of RNaDSolver.step(): one parameter update from a batch of trajectories"""
+    phase = profiler.phase if profiler else _untimed
+    if profiler:
+        # transfer the batch up front so it's timed apart from the update itself
+        with phase("device_transfer"):
+            timestep = jax.block_until_ready(jax.device_put(timestep))
+
+    with phase("learner_update"):
+        alpha, update_target_net = agent._entropy_schedule(agent.learner_steps)
+        (
+            agent.params,
+            agent.params_target,
+            agent.params_prev,
+            agent.params_prev_,
+            agent.optimizer,
+            agent.optimizer_target,
+        ), logs = agent.update_parameters(
+            agent.params,
+            agent.params_target,
+            agent.params_prev,
+            agent.params_prev_,
+            agent.optimizer,
+            agent.optimizer_target,
+            timestep,
+            alpha,
+            agent.learner_steps,
+            update_target_net,
+        )
+        if profiler:
+            logs = jax.block_until_ready(logs)
+    agent.learner_steps += 1
+    logs.update(
+        {
+            "actor_steps": agent.actor_steps,
+            "learner_steps": agent.learner_steps,
+        }
+    )
+    return logs
+
+
+class SolverRollout:
+    """RNaDSolver's own pyspiel rollout, with its parts timed by a StepProfiler.
+
+    Plays exactly like RNaDSolver.step(); it's only used when profiling, to split the step
+    into playing the games, acting with the network, batching and the learner update.
+    """
+
+    def __init__(self, agent, profiler):
+        self.agent = agent
+        self.profiler = profiler
+
+    def step(self):
+        return learner_update(
+            self.agent, self.collect_batch_trajectory(), self.profiler
+        )
+
+    def collect_batch_trajectory(self):
+        agent = self.agent
+        phase = self.profiler.phase
+        with phase("rollout_env"):
+            states = [
+                agent._play_chance(agent._game.new_initial_state())
+                for _ in range(agent.config.batch_size)
+            ]
+            env_step = agent._batch_of_states_as_env_step(states)
+        timesteps = []
+
+        for _ in range(agent.config.trajectory_max):
+            prev_env_step = env_step
+            with phase("rollout_acting"):
+                a, actor_step = agent.actor_step(env_step)
+            with phase("rollout_env"):
+                states = agent._batch_of_states_apply_action(states, a)
+                env_step = agent._batch_of_states_as_env_step(states)
+            timesteps.append(
+                rnad.TimeStep(
+                    env=prev_env_step,
+                    actor=rnad.ActorStep(
+                        action_oh=actor_step.action_oh,
+                        policy=actor_step.policy,
+                        rewards=env_step.rewards,
+                    ),
+                )
+            )
+        with phase("batching"):
+            return jax.tree_util.tree_map(lambda *xs: np.stack(xs, axis=0), *timesteps)
+
+
+class VectorRollout:
+    """Plays the trajectory batches of RNaDSolver.collect_batch_trajectory on a VectorLiarsPoker.
+
+    All `batch_size` games are stepped with one NumPy call per move instead of one pyspiel
+    state at a time. The returned TimeStep has the same layout and semantics, including the
+    dummy observation the solver uses for finished games.
+    """
+
+    def __init__(self, agent, profiler=None):
+        if agent.config.state_representation != rnad.StateRepresentation.INFO_SET:
+            raise ValueError("vectorized rollouts only support info_set states")
+        self.agent = agent
+        self.profiler = profiler
+        # the solver's RandomState deals the cards, so checkpoints capture it as before
+        self.env = VectorLiarsPoker.from_game(
+            agent._game, agent.config.batch_size, rng=agent._np_rng
+        )
+        self._ex_env_step = agent._state_as_env_step(agent._ex_state)
+
+    def step(self):
+        """RNaDSolver.step() with the vectorized rollout"""
+        return learner_update(
+            self.agent, self.collect_batch_trajectory(), self.profiler
+        )
+
+    def _as_env_step(self):
+        valid = ~self.env.is_terminal()
+        ex = self._ex_env_step
+        return rnad.EnvStep(
+            obs=np.where(
+                valid[:, None], self.env.information_state_tensor(), ex.obs
+            ).astype(np.float64),
+            legal=np.where(
+                valid[:, None], self.env.legal_actions_mask(), ex.legal
+            ).astype(np.int8),
+            player_id=np.where(valid, self.env.current_player(), ex.player_id).astype(
+                np.float64
+            ),
+            valid=valid.astype(np.float64),
+            rewards=self.env.returns(),
+        )
+
+    def collect_batch_trajectory(self):
+        agent = self.agent
+        phase = self.profiler.phase if self.profiler else _untimed
+        with phase("rollout_env"):
+            self.env.reset()
+            env_step = self._as_env_step()
+        timesteps = []
+
+        for _ in range(agent.config.trajectory_max):
+            prev_env_step = env_step
+            with phase("rollout_acting"):
+                pi = np.asarray(agent._network_jit_apply(agent.params, env_step))
+                pi = pi.astype("float64")
+                pi = pi / np.sum(pi, axis=-1, keepdims=True)
+                action = sample_actions(pi, agent._np_rng.random_sample(len(pi)))
+                action_oh = np.zeros(pi.shape, dtype="float64")
+                action_oh[range(pi.shape[0]), action] = 1.0
+
+            with phase("rollout_env"):
+                agent.actor_steps += int(np.sum(~self.env.is_terminal()))
+                self.env.step(action)
+                env_step = self._as_env_step()
+            timesteps.append(
+                rnad.TimeStep(
+                    env=prev_env_step,
+                    actor=rnad.ActorStep(
+                        action_oh=action_oh, policy=pi, rewards=env_step.rewards
+                    ),
+                )
+            )
+        # Concatenate all the timesteps together to form a single rollout [T, B, ..]
+        with phase("batching"):
+            return jax.tree_util.tree_map(lambda *xs: np.stack(xs, axis=0), *timesteps)
+
+
+def _actor_loop(
+    actor_id, snapshot, trajectories, param_updates, stop, vectorized_rollouts
+):
+    # the snapshot unpickles into a full solver; actors only use it to play trajectories
+    agent = snapshot
+    agent._np_rng = np.random.RandomState(agent.config.seed + actor_id + 1)
+    if vectorized_rollouts:
+        collect_batch_trajectory = VectorRollout(agent).collect_batch_trajectory
+    else:
+        collect_batch_trajectory = agent.collect_batch_trajectory
+
+    while not stop.is_set():
+        # only the most recent params matter, skip any the learner sent in the meantime
+        try:
+            while True:
+                agent.params = param_updates.get_nowait()
+        except queue.Empty:
+            pass
+
+        actor_steps = agent.actor_steps
+        timestep = collect_batch_trajectory()
+        trajectories.put((agent.actor_steps - actor_steps, timestep))
+
+
+class ActorLearner:
+    """Generates trajectories in `num_actors` processes while this process runs the updates.
+
+    Each actor holds a copy of the solver, plays `batch_size` games per trajectory batch with
+    the most recent params it has received, and streams the batches to the learner. Every
+    `param_sync_frequency` learner steps the learner sends its params back to the actors.
+    Actors block once `max_queued_trajectories` batches are waiting, which bounds how stale
+    the acting policy can get; RNaD's v-trace corrects for the remaining policy lag.
+
+    With a `profiler`, the learner's steps are split into waiting for a trajectory batch,
+    device transfer, the update and sending params; the actors themselves aren't profiled.
+    """
+
+    def __init__(
+        self,
+        agent,
+        num_actors: int,
+        param_sync_frequency: int = 1,
+        max_queued_trajectories: int = 4,
+        vectorized_rollouts: bool = False,
+        profiler=None,
+    ):
+        self.agent = agent
+        self.num_actors = num_actors
+        self.param_sync_frequency = param_sync_frequency
+        self.max_queued_trajectories = max_queued_trajectories
+        self.vectorized_rollouts = vectorized_rollouts
+        self.profiler = profiler
+        self._processes = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        # jax is multithreaded, so actors are started with spawn rather than fork
+        ctx = mp.get_context("spawn")
+        self._trajectories = ctx.Queue(maxsize=self.max_queued_trajectories)
+        self._param_updates = [ctx.Queue(maxsize=1) for _ in range(self.num_actors)]
+        self._stop = ctx.Event()
+
+        snapshot = snapshot_agent(self.agent)
+        for actor_id in range(self.num_actors):
+            process = ctx.Process(
+                target=_actor_loop,
+                args=(
+                    actor_id,
+                    snapshot,
+                    self._trajectories,
+                    self._param_updates[actor_id],
+                    self._stop,
+                    self.vectorized_rollouts,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+    def step(self):
+        phase = self.profiler.phase if self.profiler else _untimed
+        with phase("wait_for_trajectory"):
+            actor_steps, timestep = self._next_trajectory()
+        self.agent.actor_steps += actor_steps
+        logs = learner_update(self.agent, timestep, self.profiler)
+
+        if self.agent.learner_steps % self.param_sync_frequency == 0:
+            with phase("param_sync"):
+                self._broadcast_params()
+        return logs
+
+    def _next_trajectory(self):
+        while True:
+            try:
+                return self._trajectories.get(timeout=1.0)
+            except queue.Empty:
+                if not all(p.is_alive() for p in self._processes):
+                    raise RuntimeError("an actor process exited unexpectedly")
+
+    def _broadcast_params(self):
+        params = jax.device_get(self.agent.params)
+        for param_queue in self._param_updates:
+            # never block the learner: replace params the actor hasn't picked up yet, and if
+            # the queue is still full the actor gets the newer params at the next sync
+            for _ in range(2):
+                try:
+                    param_queue.put_nowait(params)
+                    break
+                except queue.Full:
+                    try:
+                        param_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def close(self, timeout: float = 30.0):
+        if not self._processes:
+            return
+        self._stop.set()
+
+        # keep draining so actors blocked on a full queue can see the stop event
+        deadline = time.time() + timeout
+        while any(p.is_alive() for p in self._processes) and time.time() < deadline:
+            try:
+                self._trajectories.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self._processes = []
@@ -1,16 +1,26 @@
+import collections
+import itertools
 import re
-from math import factorial as fc
+
+import numpy as np
 
 
 class BaselineModel:
+    # probability and decision tables by (hand_length, n_digits, n_players), shared by every
+    # instance; only the MAX_CACHED_TABLES most recently used game sizes are kept
+    _tables = collections.OrderedDict()
+    MAX_CACHED_TABLES = 2
+    # hands per block of generate_decision_table
+    DECISION_CHUNK_SIZE = 1024
+
     def __init__(self, hand_length, n_digits, n_players):
         self.hand_length = hand_length
         self.n_digits = n_digits
         self.n_players = n_players
         self.max_allowed_moves = hand_length * n_digits * n_players
 
-        self.n_total_digits = n_digits * n_players
-        self.n_unknown_digits = n_digits * (n_players - 1)
+        self.n_total_digits = hand_length * n_players
+        self.n_unknown_digits = hand_length * (n_players - 1)
 
         self.win_reward = n_players - 1
         self.challenge_reward = 1
@@ -30,15 +40,45 @@ class BaselineModel:
         self.count_diff = None
 
         self.digit_prob = 1.0 / self.n_digits
-        self.probs = self.generate_conditional_binomial_probs()
+        # probabilities as arrays, indexed by count_diff + hand_length - 1
+        self.prob_arrays, self.hand_codes, self.decision_table = self.shared_tables()
+        self.probs = {
+            name: dict(
+                zip(range(-(hand_length - 1), self.n_total_digits + 1), probs.tolist())
+            )
+            for name, probs in self.prob_arrays.items()
+        }
+        self.current_hand_ix = None
+
+    def shared_tables(self):
+        # (prob_arrays, hand_codes, decision_table) of this game size, built once and reused
+        # by every instance while it's among the most recently used sizes
+        key = (self.hand_length, self.n_digits, self.n_players)
+        if key in self._tables:
+            self._tables.move_to_end(key)
+            return self._tables[key]
+        self.prob_arrays = self.generate_conditional_binomial_probs()
+        tables = (self.prob_arrays, *self.generate_decision_table())
+        self._tables[key] = tables
+        while len(self._tables) > self.MAX_CACHED_TABLES:
+            self._tables.popitem(last=False)
+        return tables
+
+    @classmethod
+    def clear_tables(cls):
+        # frees the shared tables; instances keep the ones they use
+        cls._tables.clear()
 
     def set_hand(self, hand_str):
-        # hands are expected to be in the string form 12345
+        # hands are expected to be in the string form 12345, with 0 standing for 10
         self.current_hand_counts = {}
         for ix in range(1, self.n_digits + 1):
             self.current_hand_counts[ix] = sum(
-                [1 if int(s) == ix else 0 for s in hand_str]
+                [1 if int(s) == ix % 10 else 0 for s in hand_str]
             )
+        self.current_hand_ix = self.hand_index(
+            [self.current_hand_counts[ix] for ix in range(1, self.n_digits + 1)]
+        )
         # reset the count_diff so it doesn't accidentally get used
         self.count_diff = None
 
@@ -54,7 +94,7 @@ class BaselineModel:
                 "int": 0,
             }
 
-        match = re.search(r"^(\d) of (\d)$", bid_str)
+        match = re.search(r"^(\d+) of (\d+)$", bid_str)
         if not match:
             raise ValueError("unexpected bid string: %s" % bid_str)
 
@@ -90,70 +130,195 @@ class BaselineModel:
         action_map[0] = "challenge"
         return action_map
 
-    def binom_bid(self, count_diff):
-        # here we sum the binomial distribution probabilities to get the chance of winning a bid
-        # relative to the player's private hand (as by count_diff)
+    def binomial_tails(self):
+        # P(X >= k) and P(X < k), k = 0..n_unknown_digits + 1, of the count X of a digit among
+        # the unknown digits, X ~ Binomial(n_unknown_digits, digit_prob); the pmf is built in
+        # log space from the recurrence C(n, k) = C(n, k - 1) * (n - k + 1) / k, so neither
+        # factorials nor powers overflow or underflow at full game sizes
+        n = self.n_unknown_digits
+        k = np.arange(n + 1)
+        log_choose = np.concatenate(
+            [[0.0], np.cumsum(np.log(n - k[:-1]) - np.log(k[1:]))]
+        )
+        log_pmf = (
+            log_choose
+            + k * np.log(self.digit_prob)
+            + (n - k) * np.log1p(-self.digit_prob)
+        )
+        pmf = np.exp(log_pmf)
+        at_least = np.append(np.cumsum(pmf[::-1])[::-1], 0.0)
+        below = np.append(0.0, np.cumsum(pmf))
+        return at_least, below
 
-        cum_prob = 0
+    def binom_bid(self, count_diff):
+        # the chance of winning a bid relative to the player's private hand (as by count_diff)
         if count_diff <= 0:
             # I have 3 in my hand and I'm bidding 3
             return 1.0
         if count_diff > self.n_unknown_digits:
             # e.g. in 3x3 2-player, if I have 1 in my hand, there is no way there are 5 or more between both players
             return 0.0
-        while count_diff <= self.n_unknown_digits:
-            cum_prob += (
-                self.digit_prob**count_diff
-                * (1 - self.digit_prob) ** (self.n_unknown_digits - count_diff)
-                * fc(self.n_unknown_digits)
-                / fc(count_diff)
-                / fc(self.n_unknown_digits - count_diff)
-            )
-            count_diff += 1
-        return cum_prob
+        return float(self.binomial_tails()[0][count_diff])
 
     def binom_challenge(self, count_diff):
-        # here we sum the binomial distribution probabilities to get the chance of winning a challenge
-        # relative to the player's private hand (as by count_diff)
+        # the chance of winning a challenge relative to the player's private hand (as by count_diff)
         # e.g. in 3x3 2-player, if I have 3 in my hand, a -3 count diff means I'm challenging a bid of 6
         #                       and a +1 count_diff means I'm challenging a bid of 2
-        cum_prob = 0
         if -count_diff >= 0:
             # e.g. if I have 3 in my hand and challenge a bid of 1, 2, or 3, I will definitely lose
             return 0.0
         if count_diff > self.n_unknown_digits:
             # I'm winning the challenge even if every unknown digit is the right one
             return 1.0
-
-        winning_count = count_diff - 1
-        while winning_count >= 0:
-            # e.g. I have 3 in my hand and challenge a bid of 4 (count_diff = -1),
-            # I win if there are 0 in the remaining hand(s)
-            # e.g. If I have 3 in my hand and challenge a bid of 5 (count_diff = -2),
-            # I win if there are 0 or 1 in the remaining hand(s)
-
-            cum_prob += (
-                self.digit_prob**winning_count
-                * (1 - self.digit_prob) ** (self.n_unknown_digits - winning_count)
-                * fc(self.n_unknown_digits)
-                / fc(winning_count)
-                / fc(self.n_unknown_digits - winning_count)
-            )
-            winning_count -= 1
-        return cum_prob
+        # e.g. I have 3 in my hand and challenge a bid of 5 (count_diff = 2),
+        # I win if there are 0 or 1 in the remaining hand(s)
+        return float(self.binomial_tails()[1][count_diff])
 
     def generate_conditional_binomial_probs(self):
-        # this function generates the likelihood of winning a bet (x or more of a digit) or a challenge (not x or more
-        # of the digit) conditional on the difference of count in the current hand and the current bid
-        # this is a mapping to be used during decisionmaking
-
-        cond_probs_bid = {}
-        cond_probs_challenge = {}
-        for count_diff in range(-(self.hand_length - 1), self.n_total_digits + 1):
-            cond_probs_bid[count_diff] = self.binom_bid(count_diff)
-        for count_diff in range(-(self.hand_length - 1), self.n_total_digits + 1):
-            cond_probs_challenge[count_diff] = self.binom_challenge(count_diff)
-        return {"bid": cond_probs_bid, "challenge": cond_probs_challenge}
+        # the likelihood of winning a bet (x or more of a digit) or a challenge (not x or more
+        # of the digit) conditional on the difference of count in the current hand and the current bid,
+        # as arrays indexed by count_diff + hand_length - 1 over every reachable count_diff
+        at_least, below = self.binomial_tails()
+        count_diff = np.arange(-(self.hand_length - 1), self.n_total_digits + 1)
+        in_range = np.clip(count_diff, 0, self.n_unknown_digits + 1)
+        prob_bid = np.where(count_diff <= 0, 1.0, at_least[in_range])
+        prob_challenge = np.where(
+            count_diff <= 0,
+            0.0,
+            np.where(count_diff > self.n_unknown_digits, 1.0, below[in_range]),
+        )
+        return {"bid": prob_bid, "challenge": prob_challenge}
+
+    def hand_code(self, counts):
+        # digit counts [..., n_digits] as one integer, with a digit per count in base hand_length + 1
+        radix = (self.hand_length + 1) ** np.arange(self.n_digits, dtype=np.int64)
+        return np.asarray(counts, dtype=np.int64) @ radix
+
+    def hand_index(self, counts):
+        # row of the decision table for the digit counts of a hand
+        return np.searchsorted(self.hand_codes, self.hand_code(counts))
+
+    def count_diffs(self, counts, bid_ints):
+        # count_diff of bids (>= 1) for hands with digit counts [..., n_digits], offset by
+        # hand_length - 1 to index the prob_arrays
+        bid_ints = np.asarray(bid_ints)
+        bid_counts = (bid_ints - 1) // self.n_digits + 1
+        bid_digits = (bid_ints - 1) % self.n_digits
+        hand_counts = np.take_along_axis(
+            np.asarray(counts), bid_digits[..., None], axis=-1
+        )[..., 0]
+        return bid_counts - hand_counts + self.hand_length - 1
+
+    def generate_decision_table(self):
+        # the action get_next_action_int picks for every hand (by digit counts), current bid
+        # (0 before the first bid), rebid flag and use_ev, as table[hand, bid, is_rebid, use_ev];
+        # hands are the rows of the sorted hand codes returned with it
+        # every multiset of hand_length digits
+        counts = np.array(
+            [
+                np.bincount(hand, minlength=self.n_digits)
+                for hand in itertools.combinations_with_replacement(
+                    range(self.n_digits), self.hand_length
+                )
+            ]
+        )
+        codes = self.hand_code(counts)
+        order = np.argsort(codes)
+        codes, counts = codes[order], counts[order]
+
+        # a chunk of hands at a time bounds the [hands, bids] intermediates at full game sizes
+        table = np.empty(
+            (len(counts), self.max_allowed_moves + 1, 2, 2), dtype=np.int16
+        )
+        for start in range(0, len(counts), self.DECISION_CHUNK_SIZE):
+            rows = slice(start, start + self.DECISION_CHUNK_SIZE)
+            table[rows] = self.decision_rows(counts[rows])
+        return codes, table
+
+    def decision_rows(self, counts):
+        # decision table rows for hands with digit counts [hands, n_digits]
+        # the probabilities of winning every bid and challenging it [hand, bid]
+        bids = np.arange(1, self.max_allowed_moves + 1)
+        count_diff = self.count_diffs(counts[:, None, :], bids[None, :])
+        prob_bid = self.prob_arrays["bid"][count_diff]
+        prob_challenge = self.prob_arrays["challenge"][count_diff]
+
+        # best_bid[:, k]: the lowest of the most likely bids above bid k, -1 if there are none
+        n_hands = len(counts)
+        best_bid = np.full((n_hands, self.max_allowed_moves + 1), -1, dtype=np.int64)
+        prob_best = np.full((n_hands, self.max_allowed_moves + 1), -1.0)
+        for k in range(self.max_allowed_moves - 1, -1, -1):
+            # bid k + 1 wins ties, being the lower one
+            better = prob_bid[:, k] >= prob_best[:, k + 1]
+            best_bid[:, k] = np.where(better, k + 1, best_bid[:, k + 1])
+            prob_best[:, k] = np.where(better, prob_bid[:, k], prob_best[:, k + 1])
+
+        # after bid k >= 1 (column k - 1), compare the best higher bid with counting the
+        # current bid (rebid) or challenging it
+        prob_best_above = prob_best[:, 1:]
+        ev_best = self.win_reward * (2 * prob_best_above - 1)
+        stay = np.stack(
+            [
+                # not a rebid: challenge
+                np.stack(
+                    [
+                        prob_challenge >= prob_best_above,
+                        self.challenge_reward * (2 * prob_challenge - 1) >= ev_best,
+                    ],
+                    axis=-1,
+                ),
+                # rebid: count
+                np.stack(
+                    [
+                        prob_bid >= prob_best_above,
+                        self.win_reward * (2 * prob_bid - 1) >= ev_best,
+                    ],
+                    axis=-1,
+                ),
+            ],
+            axis=-2,
+        )
+        rows = np.empty((n_hands, self.max_allowed_moves + 1, 2, 2), dtype=np.int16)
+        rows[:, 0] = best_bid[:, 0, None, None]
+        rows[:, 1:] = np.where(stay, 0, best_bid[:, 1:, None, None])
+        return rows
+
+    def batch_next_actions(
+        self, hands, bid_ints, is_rebid, use_ev=False, return_win_probs=False
+    ):
+        """
+        Stateless, vectorized get_next_action_int over many positions at once.
+
+        hands: digits of each hand [N, hand_length], 0 standing for 10
+        bid_ints: openspiel integer of the current bid of each position [N], 0 before the first bid
+        is_rebid: whether each position is a rebid [N]
+        use_ev: if True, the model will take the rewards into account when deciding the move
+        return_win_probs: if True, also return the probability that each chosen action wins
+
+        returns:
+            actions: openspiel-appropriate integers [N] (and the win probabilities [N])
+        """
+        hands = np.asarray(hands)
+        bid_ints = np.asarray(bid_ints, dtype=np.int64)
+        is_rebid = np.asarray(is_rebid, dtype=bool)
+        # 0 stands for 10, as in set_hand
+        digits = np.arange(1, self.n_digits + 1) % 10
+        counts = (hands[..., None] == digits).sum(axis=-2)
+        actions = self.decision_table[
+            self.hand_index(counts), bid_ints, is_rebid.astype(np.int64), int(use_ev)
+        ].astype(np.int64)
+        if not return_win_probs:
+            return actions
+
+        # a bid wins if it counts; 0 counts the current bid on a rebid, else challenges it
+        is_bid = actions > 0
+        count_diff = self.count_diffs(counts, np.where(is_bid, actions, bid_ints))
+        win_probs = np.where(
+            is_bid | is_rebid,
+            self.prob_arrays["bid"][count_diff],
+            self.prob_arrays["challenge"][count_diff],
+        )
+        return actions, win_probs
 
     def get_bid_count_diff(self, action_ix):
         action_dict = self.actions[self.openspiel_action_int_to_str[action_ix]]
@@ -163,7 +328,8 @@ class BaselineModel:
     def get_next_action_int(self, use_ev=False):
         """
         This funtion implements the baseline model's strategy, which is based on binomial probabilities of the
-        unknown hand. The strategy produces the greediest move.
+        unknown hand. The strategy produces the greediest move. Every decision is precomputed by
+        generate_decision_table, so this is a lookup.
 
         is_rebid: if True, this player was the last bidder and is now on a rebid
         use_ev: if True, the model will take the rewards into account when deciding the move
@@ -171,63 +337,15 @@ class BaselineModel:
         returns:
             action_int: openspiel-appropriate integer for this move
         """
-        best_action_name = ""
-        best_action_ix = -1
-        prob_best_action = -1.0
-
-        # deal with initial bid:
-        if not self.current_bid["count"] and not self.current_bid["digit"]:
-            for ix in range(1, self.max_allowed_moves + 1):
-                prob = self.probs["bid"][self.get_bid_count_diff(ix)]
-                if prob > prob_best_action:
-                    prob_best_action = prob
-                    best_action_name = self.openspiel_action_int_to_str[ix]
-                    best_action_ix = ix
-            return best_action_ix
-
-        # probability of success if challenge
-        prob_challenge = self.probs["challenge"][self.count_diff]
-
-        # probability of winnig with the current bid (if rebid)
-        prob_count = self.probs["bid"][self.get_bid_count_diff(self.current_bid["int"])]
-
-        # find lowest, greediest bid
-        for ix in range(self.current_bid["int"] + 1, self.max_allowed_moves + 1):
-            prob = self.probs["bid"][self.get_bid_count_diff(ix)]
-            if prob > prob_best_action:
-                prob_best_action = prob
-                best_action_name = self.openspiel_action_int_to_str[ix]
-                best_action_ix = ix
-
-        # strategy:
-        # if this is a rebid, consider the win probability/EV of the current bid instead of challenge prob/EV
-        #   -> choose 'count' if tied with a higher bid
-        # if not a rebid, compare win probability/EV of best action with challenge prob/EV
-        #   -> choose 'challenge' if tied with a higher bid
-
-        if use_ev:
-            ev_count = self.win_reward * (2 * prob_count - 1)
-            ev_challenge = self.challenge_reward * (2 * prob_challenge - 1)
-            ev_best_action = self.win_reward * (2 * prob_best_action - 1)
-            if self.current_bid["is_rebid"]:
-                if ev_count >= ev_best_action:
-                    return 0
-                else:
-                    return best_action_ix
-            elif ev_challenge >= ev_best_action:
-                return 0
-            else:
-                return best_action_ix
-        else:
-            if self.current_bid["is_rebid"]:
-                if prob_count >= prob_best_action:
-                    return 0
-                else:
-                    return best_action_ix
-            elif prob_challenge >= prob_best_action:
-                return 0
-            else:
-                return best_action_ix
+        bid_int = self.current_bid["int"] if self.current_bid["count"] else 0
+        return int(
+            self.decision_table[
+                self.current_hand_ix,
+                bid_int,
+                int(bool(self.current_bid.get("is_rebid"))),
+                int(use_ev),
+            ]
+        )
 
     def get_next_action_str(self, use_ev=False):
         # returns the action in string format
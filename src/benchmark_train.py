@@ -0,0 +1,152 @@
+import csv
+import itertools
+import multiprocessing as mp
+import os
+import resource
+import time
+
+import numpy as np
+from jax import monitoring
+from open_spiel.python.algorithms.rnad import rnad
+
+from actor_learner import VectorRollout
+from config_schema import BenchmarkConfig
+from utils import dump_config, load_config
+
+# time jax spends tracing, lowering and compiling, reported through its monitoring events
+COMPILE_EVENTS = (
+    "/jax/core/compile/jaxpr_trace_duration",
+    "/jax/core/compile/jaxpr_to_mlir_module_duration",
+    "/jax/core/compile/backend_compile_duration",
+)
+
+FIELDS = [
+    "num_digits",
+    "hand_length",
+    "num_players",
+    "batch_size",
+    "trajectory_max",
+    "policy_network_layers",
+    "vectorized_rollouts",
+    "steps_per_sec",
+    "trajectories_per_sec",
+    "step_time_p50",
+    "step_time_p95",
+    "first_step_sec",
+    "compile_time_sec",
+    "peak_rss_mb",
+]
+
+
+def benchmark_grid(config: BenchmarkConfig) -> list[dict]:
+    grid = config.grid
+    return [
+        {
+            "num_digits": game.num_digits,
+            "hand_length": game.hand_length,
+            "num_players": game.num_players,
+            "batch_size": batch_size,
+            "trajectory_max": trajectory_max,
+            "policy_network_layers": tuple(layers),
+            "vectorized_rollouts": vectorized_rollouts,
+        }
+        for game, batch_size, trajectory_max, layers, vectorized_rollouts in (
+            itertools.product(
+                grid.game,
+                grid.batch_size,
+                grid.trajectory_max,
+                grid.policy_network_layers,
+                grid.vectorized_rollouts,
+            )
+        )
+    ]
+
+
+def benchmark_step(point: dict, warmup_steps: int, measured_steps: int, seed: int):
+    """Times RNaDSolver.step() for one grid point; meant to run in a fresh process"""
+    compile_time = 0.0
+
+    def on_duration(event, duration, **kwargs):
+        nonlocal compile_time
+        if event in COMPILE_EVENTS:
+            compile_time += duration
+
+    monitoring.register_event_duration_secs_listener(on_duration)
+
+    agent = rnad.RNaDSolver(
+        rnad.RNaDConfig(
+            game_name="python_liars_poker(num_digits={},hand_length={},players={})".format(
+                point["num_digits"], point["hand_length"], point["num_players"]
+            ),
+            batch_size=point["batch_size"],
+            trajectory_max=point["trajectory_max"],
+            policy_network_layers=point["policy_network_layers"],
+            seed=seed,
+        )
+    )
+    step = VectorRollout(agent).step if point["vectorized_rollouts"] else agent.step
+
+    def timed_step():
+        start = time.perf_counter()
+        # reading the loss waits for the asynchronously dispatched update to finish
+        float(step()["loss"])
+        return time.perf_counter() - start
+
+    first_step = timed_step()
+    for _ in range(warmup_steps - 1):
+        timed_step()
+    step_times = np.array([timed_step() for _ in range(measured_steps)])
+
+    steps_per_sec = measured_steps / step_times.sum()
+    p50, p95 = np.percentile(step_times, [50, 95])
+    return {
+        **point,
+        "policy_network_layers": "x".join(map(str, point["policy_network_layers"])),
+        "steps_per_sec": steps_per_sec,
+        "trajectories_per_sec": steps_per_sec * point["batch_size"],
+        "step_time_p50": p50,
+        "step_time_p95": p95,
+        "first_step_sec": first_step,
+        "compile_time_sec": compile_time,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_benchmark(config: BenchmarkConfig, output_path: str) -> list[dict]:
+    points = benchmark_grid(config)
+    results = []
+    # one process per grid point, so compile caches and peak memory don't carry over
+    ctx = mp.get_context("spawn")
+    with open(output_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for ix, point in enumerate(points):
+            print(f"[{ix + 1}/{len(points)}] {point}")
+            with ctx.Pool(1) as pool:
+                result = pool.apply(
+                    benchmark_step,
+                    (point, config.warmup_steps, config.measured_steps, config.seed),
+                )
+            print(
+                f"steps/sec: {result['steps_per_sec']:.2f}; "
+                f"trajectories/sec: {result['trajectories_per_sec']:.0f}; "
+                f"compile time (sec): {result['compile_time_sec']:.2f}; "
+                f"peak RSS (MB): {result['peak_rss_mb']:.0f}"
+            )
+            writer.writerow(result)
+            f.flush()
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    config = load_config("../config_benchmark.yaml", config_type="benchmark")
+
+    # set up IO
+    os.makedirs(config.output_dir, exist_ok=True)
+    ts = dump_config(config, config.output_dir)
+    output_path = os.path.join(config.output_dir, f"benchmark_{ts}.csv")
+
+    run_benchmark(config, output_path)
+    print(f"results written to {output_path}")
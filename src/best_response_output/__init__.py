@@ -1 +1,63 @@
-BR_HEADER = "saved_agent_path,checkpoint,num_train_episodes,eval_every,eval_episodes,rolling_window_size,learning_rate,rolling_avg_value,total_avg_value,rolling_value_p0,rolling_value_p1,rolling_value_p2,runtime_in_hrs,replay_buffer_capacity,rolling_std,rolling_std_p0,rolling_std_p1,rolling_std_p2"
+# position-level columns always cover at least 3 seats, padded with -1, so summaries of
+# 2 and 3 player games share a header
+MIN_POSITION_COLUMNS = 3
+
+
+def br_header(num_players: int) -> str:
+    positions = range(max(num_players, MIN_POSITION_COLUMNS))
+    return ",".join(
+        [
+            "saved_agent_path",
+            "checkpoint",
+            "num_train_episodes",
+            "eval_every",
+            "eval_episodes",
+            "rolling_window_size",
+            "learning_rate",
+            "rolling_avg_value",
+            "total_avg_value",
+            *[f"rolling_value_p{p}" for p in positions],
+            "runtime_in_hrs",
+            "replay_buffer_capacity",
+            "rolling_std",
+            *[f"rolling_std_p{p}" for p in positions],
+        ]
+    )
+
+
+def br_summary_row(
+    saved_agent_path: str,
+    checkpoint: int,
+    num_train_episodes: int,
+    eval_every: int,
+    eval_episodes: int,
+    rolling_window_size: int,
+    learning_rate: float,
+    rolling_avg_value: float,
+    total_avg_value: float,
+    rolling_values,
+    runtime_in_hours: float,
+    replay_buffer_capacity: int,
+    rolling_std: float,
+    rolling_stds,
+) -> str:
+    """One line of the summary file, matching br_header(len(rolling_values))"""
+    padding = [-1] * (MIN_POSITION_COLUMNS - len(rolling_values))
+    return ",".join(
+        [
+            saved_agent_path,
+            "%d" % checkpoint,
+            "%d" % num_train_episodes,
+            "%d" % eval_every,
+            "%d" % eval_episodes,
+            "%d" % rolling_window_size,
+            "%.3f" % learning_rate,
+            "%.3f" % rolling_avg_value,
+            "%.3f" % total_avg_value,
+            *["%.3f" % value for value in [*rolling_values, *padding]],
+            "%.2f" % runtime_in_hours,
+            "%d" % replay_buffer_capacity,
+            "%.4f" % rolling_std,
+            *["%.4f" % std for std in [*rolling_stds, *padding]],
+        ]
+    )
@@ -1,23 +1,48 @@
+import collections
 import json
+import multiprocessing as mp
 import os
-import pickle
+import re
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 import cloudpickle
+import jax
 import numpy as np
 import pyspiel
 from open_spiel.python import rl_agent, rl_environment
-from open_spiel.python.algorithms.rnad import rnad
 from open_spiel.python.jax import dqn
 from tqdm import trange
 
-from best_response_output import BR_HEADER
+from best_response_output import br_header, br_summary_row
+from compilation_cache import checkpoint_cache_key, enable_compilation_cache
+from policy_cache import cached_policy
+from policy_checkpoint import (
+    SharedPolicy,
+    find_checkpoint,
+    load_policy,
+    sample_actions,
+)
+from replay_buffer import ArrayReplayDQN
 from utils import dump_config, load_config
+from vector_env import FULL_DECK
+
+
+def load_game(config):
+    return pyspiel.load_game(
+        "python_liars_poker",
+        {
+            "players": config.game.num_players,
+            "num_digits": config.game.num_digits,
+            "hand_length": config.game.hand_length,
+        },
+    )
 
 
 def create_training_agents(game, num_players, dqn_config):
     return [
-        dqn.DQN(
+        ArrayReplayDQN(
             player_id=idx,
             state_representation_size=(game.information_state_tensor_shape()[0]),
             num_actions=game.num_distinct_actions(),
@@ -27,78 +52,598 @@ def create_training_agents(game, num_players, dqn_config):
     ]
 
 
-def get_action(rng, agent, env, time_step, is_evaluation=False):
-    if isinstance(agent, rl_agent.AbstractAgent):
-        return agent.step(time_step, is_evaluation=is_evaluation).action
-    elif isinstance(agent, rnad.RNaDSolver):
-        action_probs = agent.action_probabilities(env.get_state)
-        return rng.choice(list(action_probs.keys()), p=list(action_probs.values()))
-    else:
-        raise RuntimeError("unknown agent type")
-
-
-def eval_against_fixed_bots(rng, env, trained_agents, fixed_agents, num_episodes):
-    """Evaluates `trained_agents` against `fixed_agents` for `num_episodes`."""
-    num_players = len(fixed_agents)
-    sum_episode_rewards = np.zeros(num_players)
-    for player_pos in range(num_players):
-        cur_agents = fixed_agents[:]
-        cur_agents[player_pos] = trained_agents[player_pos]
-        for _ in range(num_episodes):
-            time_step = env.reset()
-            episode_rewards = 0
-            turn_num = 0
-            while not time_step.last():
-                turn_num += 1
-                player_id = time_step.observations["current_player"]
-                if env.is_turn_based:
-                    action_list = [
-                        get_action(
-                            rng,
-                            cur_agents[player_id],
-                            env,
-                            time_step,
-                            is_evaluation=True,
-                        )
-                    ]
-                else:
-                    action_list = [
-                        get_action(agent, env, time_step, is_evaluation=True)
-                        for agent in cur_agents
-                    ]
-                time_step = env.step(action_list)
-                episode_rewards += time_step.rewards[
-                    player_pos
-                ]  # grab the rewards for only the exploiting agent
-            sum_episode_rewards[player_pos] += episode_rewards
-    return sum_episode_rewards / num_episodes
-
-
-class RollingAverage(object):
-    """Class to store a rolling average."""
-
-    def __init__(self, size=100):
+def legal_actions_mask(legal_actions, num_actions):
+    mask = np.zeros(num_actions)
+    mask[legal_actions] = 1.0
+    return mask
+
+
+def greedy_actions(agent, info_states, legal_masks):
+    """The evaluation (epsilon = 0) actions of a DQN agent for a batch of decisions"""
+    q_values = np.asarray(agent.hk_network_apply(agent.params_q_network, info_states))
+    legal_q_values = q_values + (1 - legal_masks) * dqn.ILLEGAL_ACTION_LOGITS_PENALTY
+    return np.argmax(legal_q_values, axis=-1)
+
+
+def exploitee_actions(rng, exploitee, envs):
+    """Samples the exploitee's actions in `envs` with one batched forward pass"""
+    probs = exploitee.states_policy_matrix([env.get_state for env in envs])
+    return sample_actions(probs, rng.random(len(envs)))
+
+
+def play_eval_episodes(rng, envs, trained_agent, exploitee, player_pos, num_episodes):
+    """Total reward of `trained_agent` in `player_pos` over `num_episodes` evaluation episodes.
+
+    The episodes are spread over `envs`, which are played in lockstep: at each turn the
+    exploitee's decisions across all environments are one batched forward pass, and so are
+    the trained agent's greedy decisions.
+    """
+    num_actions = envs[0].action_spec()["num_actions"]
+    remaining = [len(x) for x in np.array_split(np.arange(num_episodes), len(envs))]
+    time_steps = [env.reset() if n > 0 else None for env, n in zip(envs, remaining)]
+
+    total_rewards = 0
+    while any(time_step is not None for time_step in time_steps):
+        active = [
+            ix for ix, time_step in enumerate(time_steps) if time_step is not None
+        ]
+        trained = [
+            ix
+            for ix in active
+            if time_steps[ix].observations["current_player"] == player_pos
+        ]
+        fixed = [ix for ix in active if ix not in trained]
+
+        actions = {}
+        if trained:
+            observations = [time_steps[ix].observations for ix in trained]
+            info_states = np.array([o["info_state"][player_pos] for o in observations])
+            legal_masks = np.array(
+                [
+                    legal_actions_mask(o["legal_actions"][player_pos], num_actions)
+                    for o in observations
+                ]
+            )
+            actions.update(
+                zip(trained, greedy_actions(trained_agent, info_states, legal_masks))
+            )
+        if fixed:
+            actions.update(
+                zip(
+                    fixed, exploitee_actions(rng, exploitee, [envs[ix] for ix in fixed])
+                )
+            )
+
+        for ix in active:
+            time_step = envs[ix].step([int(actions[ix])])
+            # grab the rewards for only the exploiting agent
+            total_rewards += time_step.rewards[player_pos]
+            if time_step.last():
+                remaining[ix] -= 1
+                time_step = envs[ix].reset() if remaining[ix] > 0 else None
+            time_steps[ix] = time_step
+    return total_rewards
+
+
+def play_training_episodes(rng, envs, all_agents, exploitee):
+    """Plays one training episode of every line-up in `all_agents`, one per env, in lockstep.
+
+    Each DQN agent only sits in one line-up, so the episodes are independent; the exploitee's
+    pending decisions across all of them are evaluated in one batched forward pass.
+    """
+    time_steps = [env.reset() for env in envs]
+    active = list(range(len(envs)))
+    while active:
+        actions = {}
+        fixed = []
+        for ix in active:
+            player_id = time_steps[ix].observations["current_player"]
+            agent = all_agents[ix][player_id]
+            if isinstance(agent, rl_agent.AbstractAgent):
+                actions[ix] = agent.step(time_steps[ix]).action
+            else:
+                fixed.append(ix)
+        if fixed:
+            actions.update(
+                zip(
+                    fixed, exploitee_actions(rng, exploitee, [envs[ix] for ix in fixed])
+                )
+            )
+
+        for ix in active:
+            time_steps[ix] = envs[ix].step([int(actions[ix])])
+            if time_steps[ix].last():
+                # Episode is over, step all DQN agents with final info state.
+                for agent in all_agents[ix]:
+                    if isinstance(agent, rl_agent.AbstractAgent):
+                        agent.step(time_steps[ix])
+        active = [ix for ix in active if not time_steps[ix].last()]
+
+
+def epsilon_greedy_actions(rng, agent, info_states, legal_masks, epsilon):
+    """Epsilon-greedy actions of a DQN agent for a batch of decisions, in one forward pass"""
+    actions = greedy_actions(agent, info_states, legal_masks)
+    for ix in np.flatnonzero(rng.random(len(actions)) < epsilon):
+        actions[ix] = rng.choice(np.flatnonzero(legal_masks[ix]))
+    return actions
+
+
+def make_transition(previous, time_step, player_id, num_actions):
+    """The DQN transition from the agent's `previous` (info state, action) to `time_step`"""
+    info_state, action = previous
+    observations = time_step.observations
+    return dqn.Transition(
+        info_state=info_state,
+        action=action,
+        reward=time_step.rewards[player_id],
+        next_info_state=observations["info_state"][player_id][:],
+        is_final_step=float(time_step.last()),
+        legal_actions_mask=legal_actions_mask(
+            observations["legal_actions"][player_id], num_actions
+        ),
+    )
+
+
+def add_transitions(agent, transitions):
+    agent.replay_buffer.extend(transitions)
+
+
+def count_training_steps(agent, num_steps):
+    """Counts `num_steps` steps of a DQN agent, ie its decisions and finished episodes.
+
+    The agent learns and updates its target network on the same schedule as agent.step.
+    """
+    for _ in range(num_steps):
+        agent._step_counter += 1
+        if agent._step_counter % agent._learn_every == 0:
+            agent._last_loss_value = agent.learn()
+        if agent._step_counter % agent._update_target_network_every == 0:
+            agent.params_target_q_network = jax.tree_util.tree_map(
+                lambda x: x.copy(), agent.params_q_network
+            )
+
+
+def play_vectorized_training_episodes(rng, envs, learning_agents, exploitee):
+    """Plays one training episode in each of `envs`, in lockstep.
+
+    The DQN agent of env `ix` sits in seat `ix % num_players` and the exploitee in the
+    others, so each seat has len(envs) / num_players environments. At every turn the
+    pending decisions of each DQN agent are one batched epsilon-greedy forward pass, it
+    learns on the same schedule as if it had stepped through them one at a time, and their
+    transitions are then added to its replay buffer together. Like agent.step, the final
+    step of every episode counts as a step of its DQN agent.
+    """
+    num_players = len(learning_agents)
+    num_actions = envs[0].action_spec()["num_actions"]
+    time_steps = [env.reset() for env in envs]
+    # the DQN agent's last (info state, action) in each env, for its next transition
+    previous = [None] * len(envs)
+    active = list(range(len(envs)))
+    while active:
+        actions = {}
+        for seat, agent in enumerate(learning_agents):
+            ixs = [
+                ix
+                for ix in active
+                if ix % num_players == seat
+                and time_steps[ix].observations["current_player"] == seat
+            ]
+            if not ixs:
+                continue
+            observations = [time_steps[ix].observations for ix in ixs]
+            info_states = np.array([o["info_state"][seat] for o in observations])
+            legal_masks = np.array(
+                [
+                    legal_actions_mask(o["legal_actions"][seat], num_actions)
+                    for o in observations
+                ]
+            )
+            epsilon = agent._get_epsilon(is_evaluation=False)
+            seat_actions = epsilon_greedy_actions(
+                rng, agent, info_states, legal_masks, epsilon
+            )
+
+            count_training_steps(agent, len(ixs))
+            add_transitions(
+                agent,
+                [
+                    make_transition(previous[ix], time_steps[ix], seat, num_actions)
+                    for ix in ixs
+                    if previous[ix] is not None
+                ],
+            )
+            for ix, info_state, action in zip(ixs, info_states, seat_actions):
+                previous[ix] = (info_state, int(action))
+                actions[ix] = action
+        fixed = [ix for ix in active if ix not in actions]
+        if fixed:
+            actions.update(
+                zip(
+                    fixed, exploitee_actions(rng, exploitee, [envs[ix] for ix in fixed])
+                )
+            )
+
+        num_finished = collections.Counter()
+        final_transitions = collections.defaultdict(list)
+        for ix in active:
+            time_steps[ix] = envs[ix].step([int(actions[ix])])
+            if time_steps[ix].last():
+                seat = ix % num_players
+                num_finished[seat] += 1
+                if previous[ix] is not None:
+                    final_transitions[seat].append(
+                        make_transition(previous[ix], time_steps[ix], seat, num_actions)
+                    )
+        for seat, num_steps in num_finished.items():
+            count_training_steps(learning_agents[seat], num_steps)
+            add_transitions(learning_agents[seat], final_transitions[seat])
+        active = [ix for ix in active if not time_steps[ix].last()]
+
+
+class DealSampler(rl_environment.ChanceEventSampler):
+    """Chance event sampler that deals the queued deals, then falls back to random deals.
+
+    A deal is the sequence of chance outcomes of one episode: every player's hand, dealt
+    one digit per player at a time.
+    """
+
+    def __init__(self, seed=None):
+        super().__init__(seed)
+        self._outcomes = collections.deque()
+
+    def queue_deals(self, deals):
+        self._outcomes = collections.deque(int(x) for x in np.ravel(deals))
+
+    def __call__(self, state):
+        if self._outcomes:
+            return self._outcomes.popleft()
+        return super().__call__(state)
+
+
+def enumerate_deals(game, deal_indices) -> np.ndarray:
+    """Chance outcomes [len(deal_indices), deal length] of the numbered deals.
+
+    The num_digits ** (num_players * hand_length) deals are all equally likely, and are
+    numbered in lexicographic order of their chance outcomes.
+    """
+    deck = np.array(FULL_DECK[: game.num_digits])
+    deal_length = game.num_players() * game.hand_length
+    digits = np.unravel_index(deal_indices, (game.num_digits,) * deal_length)
+    return deck[np.stack(digits, axis=-1)]
+
+
+# the most deals a seat's shuffled deal order is built over; above it (eg for every
+# full-size game) evaluations fall back to random deals
+MAX_STRATIFIED_DEALS = 10_000_000
+
+
+def use_stratified_deals(config) -> bool:
+    """Whether evaluations deal stratified, rather than random, deals.
+
+    With fewer evaluation episodes than deals, a seat plays a prefix of its shuffled deal
+    order, ie deals sampled without replacement, which still has lower variance than
+    random deals. Only deal spaces of up to MAX_STRATIFIED_DEALS are shuffled, though.
+    """
+    num_deals = config.game.num_digits ** (
+        config.game.num_players * config.game.hand_length
+    )
+    return config.train.eval_deals == "stratified" and num_deals <= MAX_STRATIFIED_DEALS
+
+
+class EvalContext:
+    """Everything an evaluation needs besides the DQN params.
+
+    Holds its own environments, the exploitee policy of `policy_handle` shared by every
+    seat, and a DQN agent per seat that evaluation snapshots of the BR agents' params are
+    loaded into. With stratified deals, the evaluation episodes of a seat cycle through
+    every possible deal, in an order shuffled per seat (so with fewer episodes than deals,
+    they're deals sampled without replacement).
+    """
+
+    def __init__(self, config, policy_handle):
+        self.game = load_game(config)
+        self.stratified_deals = use_stratified_deals(config)
+        self.num_deals = self.game.num_digits ** (
+            config.game.num_players * config.game.hand_length
+        )
+        self._deal_order = (None, None)
+        self.envs = [
+            rl_environment.Environment(
+                self.game, include_full_state=True, chance_event_sampler=DealSampler()
+            )
+            for _ in range(config.train.eval_concurrent_envs)
+        ]
+        self.exploitee = cached_policy(
+            policy_handle.load(), config.train.policy_cache_size
+        )
+        self.agents = create_training_agents(
+            self.game, config.game.num_players, config.train.dqn.model_dump()
+        )
+
+    def deal_order(self, seat_key):
+        # the seat's shuffled deal order, kept for the seat's next shards
+        if self._deal_order[0] != seat_key:
+            rng = np.random.default_rng(np.random.SeedSequence(seat_key))
+            self._deal_order = (seat_key, rng.permutation(self.num_deals))
+        return self._deal_order[1]
+
+    def eval_shard(self, params, player_pos, episodes, seat_key, shard):
+        """Total reward of seat `player_pos` over one shard of evaluation episodes.
+
+        `episodes` are the shard's indices among the seat's evaluation episodes. The
+        chance events and exploitee actions are drawn from generators seeded by `seat_key`
+        and `shard`, so a shard gives the same result wherever it runs.
+        """
+        seeds = np.random.SeedSequence((*seat_key, shard)).generate_state(
+            len(self.envs) + 1
+        )
+        for env, env_seed in zip(self.envs, seeds[1:]):
+            env.seed(int(env_seed))
+        rng = np.random.default_rng(seeds[0])
+
+        if self.stratified_deals:
+            # the same deal order for every shard of the seat, each taking its episodes'
+            # deals in the order play_eval_episodes spreads them over the environments
+            order = self.deal_order(seat_key)
+            env_episodes = np.array_split(np.asarray(episodes), len(self.envs))
+            for env, ixs in zip(self.envs, env_episodes):
+                env._chance_event_sampler.queue_deals(
+                    enumerate_deals(self.game, order[ixs % self.num_deals])
+                )
+
+        trained_agent = self.agents[player_pos]
+        trained_agent.params_q_network = params
+        return play_eval_episodes(
+            rng, self.envs, trained_agent, self.exploitee, player_pos, len(episodes)
+        )
+
+
+_eval_context = None
+
+
+def _init_eval_worker(config, policy_handle):
+    global _eval_context
+    _eval_context = EvalContext(config, policy_handle)
+
+
+def _eval_shard_in_worker(params, player_pos, episodes, seat_key, shard):
+    return _eval_context.eval_shard(params, player_pos, episodes, seat_key, shard)
+
+
+class Evaluator:
+    """Evaluates the BR agents in every seat against the exploitee while training continues.
+
+    `submit` takes a frozen snapshot of the DQN params. Each seat's `num_episodes` are split
+    into `num_shards` shards, run on a pool of `num_workers` processes (or in this process,
+    blocking, if `num_workers` is 0). Every shard is seeded from (seed, evaluation, seat,
+    shard), so results are reproducible for a given seed regardless of the number of
+    workers; with common random numbers the evaluation is left out, so every evaluation
+    plays the same deals with the same random draws and only the BR agents' params
+    differ. `completed` yields finished evaluations in the order they were submitted.
+    """
+
+    def __init__(
+        self,
+        config,
+        policy_handle,
+        num_workers: int,
+        num_shards: int,
+        max_pending: int = 2,
+    ):
+        self.num_players = config.game.num_players
+        self.num_episodes = config.train.evaluate_num_episodes
+        self.num_shards = min(num_shards, self.num_episodes)
+        self.max_pending = max_pending
+        # a fixed entropy, even without a seed, so every evaluation draws fresh episodes,
+        # or, with common random numbers, replays the same deals and random draws
+        self.seed = np.random.SeedSequence(config.train.seed).entropy
+        self.common_random_numbers = config.train.eval_common_random_numbers
+        self._num_submitted = 0
+        self._pending = collections.deque()
+
+        if num_workers > 0:
+            self._context = None
+            self._pool = ProcessPoolExecutor(
+                num_workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_eval_worker,
+                initargs=(config, policy_handle),
+            )
+        else:
+            self._context = EvalContext(config, policy_handle)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+
+    def _shards(self):
+        episodes = np.array_split(np.arange(self.num_episodes), self.num_shards)
+        for player_pos in range(self.num_players):
+            if self.common_random_numbers:
+                seat_key = (self.seed, player_pos)
+            else:
+                seat_key = (self.seed, self._num_submitted, player_pos)
+            for shard, shard_episodes in enumerate(episodes):
+                episode_range = range(shard_episodes[0], shard_episodes[-1] + 1)
+                yield player_pos, episode_range, seat_key, shard
+
+    def submit(self, learning_agents, ep: int):
+        # wait for the oldest evaluation rather than queueing up more than max_pending
+        if len(self._pending) >= self.max_pending:
+            futures.wait([result for _, result in self._pending[0][1]])
+
+        params = [jax.device_get(agent.params_q_network) for agent in learning_agents]
+        results = []
+        for player_pos, *shard_args in self._shards():
+            if self._pool is None:
+                result = futures.Future()
+                result.set_result(
+                    self._context.eval_shard(
+                        params[player_pos], player_pos, *shard_args
+                    )
+                )
+            else:
+                result = self._pool.submit(
+                    _eval_shard_in_worker,
+                    params[player_pos],
+                    player_pos,
+                    *shard_args,
+                )
+            results.append((player_pos, result))
+        self._pending.append((ep, results))
+        self._num_submitted += 1
+
+    def completed(self, wait: bool = False):
+        """Yields (ep, mean reward per seat) of finished evaluations, oldest first"""
+        while self._pending:
+            ep, results = self._pending[0]
+            if wait:
+                futures.wait([result for _, result in results])
+            elif not all(result.done() for _, result in results):
+                return
+            self._pending.popleft()
+
+            sum_episode_rewards = np.zeros(self.num_players)
+            for player_pos, result in results:
+                sum_episode_rewards[player_pos] += result.result()
+            yield ep, sum_episode_rewards / self.num_episodes
+
+
+class RollingStats:
+    """Rolling mean and standard deviation of the last `size` rows of `width` values.
+
+    The window is a [size, width] ring buffer with running sums of the values and their
+    squares, so adding a row and reading the statistics are O(width). The sums are
+    recomputed from the buffer every time it wraps around, so rounding errors don't pile up.
+    """
+
+    def __init__(self, size: int, width: int):
         self._size = size
-        self._values = np.array([0] * self._size, dtype=np.float64)
+        self._values = np.zeros((size, width), dtype=np.float64)
+        self._sum = np.zeros(width)
+        self._sum_squares = np.zeros(width)
         self._index = 0
         self._total_additions = 0
 
-    def add(self, value):
-        self._values[self._index] = value
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        old = self._values[self._index]
+        self._sum += values - old
+        self._sum_squares += values**2 - old**2
+        self._values[self._index] = values
         self._total_additions += 1
         self._index = (self._index + 1) % self._size
+        if self._index == 0:
+            self._sum = self._values.sum(axis=0)
+            self._sum_squares = (self._values**2).sum(axis=0)
+
+    def _count(self) -> int:
+        return min(self._size, self._total_additions)
 
-    def mean(self):
-        n = min(self._size, self._total_additions)
+    def mean(self) -> np.ndarray:
+        n = self._count()
         if n == 0:
-            return 0
-        return self._values.sum() / n
+            return np.zeros_like(self._sum)
+        return self._sum / n
 
-    def stdev(self):
-        n = min(self._size, self._total_additions)
+    def stdev(self) -> np.ndarray:
+        n = self._count()
         if n == 0:
-            return 0
-        return np.std(self._values[0:n])
+            return np.zeros_like(self._sum)
+        variance = self._sum_squares / n - (self._sum / n) ** 2
+        return np.sqrt(np.maximum(variance, 0))
+
+
+class EarlyStopping:
+    """Decides when BR training has converged.
+
+    Training has converged once, for `patience` consecutive evaluations with a full rolling
+    window, the rolling value moved by at most `tolerance` since the previous evaluation
+    and the rolling std was at most `max_std`.
+    """
+
+    def __init__(
+        self, patience: int, tolerance: float, max_std: float, window_size: int
+    ):
+        self.patience = patience
+        self.tolerance = tolerance
+        self.max_std = max_std
+        self.window_size = window_size
+        self._num_updates = 0
+        self._num_stable = 0
+        self._previous_value = None
+
+    def update(self, rolling_value: float, rolling_std: float) -> bool:
+        """Records an evaluation's rolling stats; True once training has converged"""
+        self._num_updates += 1
+        stable = (
+            self._num_updates >= self.window_size
+            and self._previous_value is not None
+            and abs(rolling_value - self._previous_value) <= self.tolerance
+            and rolling_std <= self.max_std
+        )
+        self._num_stable = self._num_stable + 1 if stable else 0
+        self._previous_value = rolling_value
+        return self._num_stable >= self.patience
+
+
+def find_warm_start(save_dir: str, filename_template: str, agent_step: int):
+    """Path of the saved BR agents of the nearest checkpoint before `agent_step`, if any"""
+    pattern = re.compile(
+        re.escape(filename_template).replace(re.escape("%d"), r"(\d+)") + "$"
+    )
+    steps = [
+        int(m.group(1))
+        for m in map(pattern.match, os.listdir(save_dir))
+        if m and int(m.group(1)) < agent_step
+    ]
+    if not steps:
+        return None
+    return os.path.join(save_dir, filename_template % max(steps))
+
+
+def warm_start(learning_agents, path: str) -> bool:
+    """Continues training from the BR agents saved in `path`, seat by seat.
+
+    The networks, optimizer state and step counter (and so epsilon) carry over; the replay
+    buffers start empty, since their transitions were played against another exploitee.
+    """
+    try:
+        with open(path, "rb") as f:
+            saved_agents = cloudpickle.load(f)
+    except Exception as e:
+        print(f"not warm starting from {path}: it couldn't be loaded ({e!r})")
+        return False
+    if not isinstance(saved_agents, list) or len(saved_agents) != len(learning_agents):
+        print(f"not warm starting from {path}: it doesn't hold an agent for every seat")
+        return False
+    for agent, saved in zip(learning_agents, saved_agents):
+        agent.params_q_network = saved.params_q_network
+        agent.params_target_q_network = saved.params_target_q_network
+        agent._opt_state = saved._opt_state
+        agent._step_counter = saved._step_counter
+    print(f"warm starting the BR agents from {path}")
+    return True
+
+
+def agents_summary(learning_agents) -> list[dict]:
+    return [
+        {
+            "seat": agent.player_id,
+            "step_counter": agent._step_counter,
+            "epsilon": agent._get_epsilon(is_evaluation=False),
+            "last_loss": None if agent.loss is None else float(agent.loss),
+            "replay_buffer": agent.replay_buffer.summary(),
+        }
+        for agent in learning_agents
+    ]
 
 
 def train(
@@ -118,34 +663,56 @@ def train(
 
     # Load Liar's Poker Game
 
-    game = pyspiel.load_game(
-        "python_liars_poker",
-        {
-            "players": config.game.num_players,
-            "num_digits": config.game.num_digits,
-            "hand_length": config.game.hand_length,
-        },
-    )
-    env = rl_environment.Environment(game, include_full_state=True)
+    game = load_game(config)
     num_players = config.game.num_players
+    # train_envs_per_seat environments per seat permutation, whose training episodes are
+    # played together; with more than one, the DQN agents' decisions are batched
+    envs_per_seat = config.train.train_envs_per_seat
+    if config.train.evaluate_every % envs_per_seat:
+        raise ValueError("train_envs_per_seat must divide evaluate_every")
+    if config.train.num_train_episodes % envs_per_seat:
+        raise ValueError("train_envs_per_seat must divide num_train_episodes")
+    if config.train.eval_deals == "stratified" and not use_stratified_deals(config):
+        print(
+            f"more than {MAX_STRATIFIED_DEALS} possible deals, "
+            "evaluating on random deals instead of stratified ones"
+        )
+    envs = [
+        rl_environment.Environment(game, include_full_state=True)
+        for _ in range(num_players * envs_per_seat)
+    ]
 
-    saved_agent_path = os.path.join(
-        config.io.input_dir, f"agent_{config.agent_step}.pickle"
+    saved_agent_path = find_checkpoint(config.io.input_dir, config.agent_step)
+
+    # reuse the programs compiled by earlier runs against the same network and game;
+    # enabled before the checkpoint is loaded, which compiles a pickled solver's networks
+    compilation_cache = enable_compilation_cache(
+        config.compilation_cache,
+        {
+            "script": "best_response",
+            "game": config.game.model_dump(),
+            "dqn": config.train.dqn.model_dump(),
+            "exploitee": checkpoint_cache_key(saved_agent_path),
+        },
     )
-    if not os.path.isfile(saved_agent_path):
-        raise ValueError(f"Unable to find checkpoint at {saved_agent_path}")
 
-    # Load agents from checkpoint
+    # Load agent from checkpoint; every exploitee seat shares the same policy, and the
+    # evaluation workers map its params from shared memory instead of reloading it
     print("loading agent from: %s" % saved_agent_path)
-    exploitee_agents = []
-    for idx in range(num_players):
-        with open(saved_agent_path, "rb") as f:
-            exploitee_agents.append(pickle.load(f))
+    policy_handle = SharedPolicy.from_policy(load_policy(saved_agent_path))
+    exploitee = cached_policy(policy_handle.load(), config.train.policy_cache_size)
+    exploitee_agents = [exploitee] * num_players
 
     # Create DQN best response agents
     learning_agents = create_training_agents(
         game, num_players, config.train.dqn.model_dump()
     )
+    if config.train.warm_start:
+        warm_start_path = find_warm_start(
+            save_dir, config.io.output_agent_filename, config.agent_step
+        )
+        if warm_start_path is not None:
+            warm_start(learning_agents, warm_start_path)
 
     # we train all permutations of players
     # each permutation has one best response agent and (num_players - 1) Liar's Poker agents
@@ -157,171 +724,146 @@ def train(
         for i in range(num_players)
     ]
 
-    # TODO rewrite to handle more than 4 players
-    rolling_window_size = config.train.rolling_window_size
-    rolling_averager = RollingAverage(rolling_window_size)
-    rolling_averager_p0 = RollingAverage(rolling_window_size)
-    rolling_averager_p1 = RollingAverage(rolling_window_size)
-    if num_players > 2:
-        rolling_averager_p2 = RollingAverage(rolling_window_size)
-    if num_players > 3:
-        rolling_averager_p3 = RollingAverage(rolling_window_size)
+    # the first column is the value averaged over the seats, then one column per seat
+    rolling_stats = RollingStats(config.train.rolling_window_size, 1 + num_players)
     total_value = 0
     total_value_n = 0
+    early_stopping = None
+    if config.train.early_stopping_patience:
+        early_stopping = EarlyStopping(
+            config.train.early_stopping_patience,
+            config.train.early_stopping_tolerance,
+            config.train.early_stopping_max_std,
+            config.train.rolling_window_size,
+        )
+    # training episodes actually played, which early stopping can cut short
+    num_train_episodes = config.train.num_train_episodes
+    converged = False
 
     print("Training DQN agent...")
     start_time = datetime.now()
-    for ep in trange(config.train.num_train_episodes):
-        if (ep + 1) % config.train.evaluate_every == 0:
-            r_mean = eval_against_fixed_bots(
-                rng,
-                env,
-                learning_agents,
-                exploitee_agents,
-                config.train.evaluate_num_episodes,
-            )
-            value = sum(r_mean)
-
-            rolling_averager.add(value / num_players)
-            rolling_averager_p0.add(r_mean[0])
-            rolling_averager_p1.add(r_mean[1])
-            rolling_value = rolling_averager.mean()
-            rolling_value_p0 = rolling_averager_p0.mean()
-            rolling_value_p1 = rolling_averager_p1.mean()
-            rolling_std = rolling_averager.stdev()
-            rolling_std_p0 = rolling_averager_p0.stdev()
-            rolling_std_p1 = rolling_averager_p1.stdev()
-            if num_players > 2:
-                rolling_averager_p2.add(r_mean[2])
-                rolling_value_p2 = rolling_averager_p2.mean()
-                rolling_std_p2 = rolling_averager_p2.stdev()
-            if num_players > 3:
-                rolling_averager_p3.add(r_mean[3])
-                rolling_value_p3 = rolling_averager_p3.mean()
-                rolling_std_p3 = rolling_averager_p3.stdev()
-
-            total_value += value
-            total_value_n += 1
-            avg_value = total_value / total_value_n / num_players
-
-            log_values = {
-                "epoch": ep,
-                "mean_rewards_p0": r_mean[0],
-                "mean_rewards_p1": r_mean[1],
-                "eval_avg_value": value / num_players,
-                "rolling_value_p0": rolling_value_p0,
-                "rolling_value_p1": rolling_value_p1,
-                "rolling_std_p0": rolling_std_p0,
-                "rolling_std_p1": rolling_std_p1,
-                "rolling_avg_value": rolling_value,
-                "rolling_avg_std": rolling_std,
-                "total_avg_value": avg_value,
-            }
-            if num_players > 2:
-                log_values.update(
-                    {
-                        "mean_rewards_p2": r_mean[2],
-                        "rolling_value_p2": rolling_value_p2,
-                        "rolling_std_p2": rolling_std_p2,
-                    }
+    # evaluations run on a frozen copy of the DQN params alongside training, and are
+    # recorded once they finish; the final one is waited for
+    with (
+        policy_handle,
+        Evaluator(
+            config,
+            policy_handle,
+            num_workers=config.train.eval_num_workers,
+            num_shards=config.train.eval_shards_per_seat,
+        ) as evaluator,
+    ):
+        # each iteration plays envs_per_seat training episodes in every seat
+        for ep in trange(0, config.train.num_train_episodes, envs_per_seat):
+            if (ep + envs_per_seat) % config.train.evaluate_every == 0:
+                evaluator.submit(learning_agents, ep + envs_per_seat - 1)
+
+            # with early stopping, each evaluation is waited for before training goes on,
+            # so where training stops doesn't depend on when the evaluations finish
+            last_ep = ep + envs_per_seat >= config.train.num_train_episodes
+            wait = last_ep or early_stopping is not None
+            for eval_ep, r_mean in evaluator.completed(wait=wait):
+                value = sum(r_mean)
+
+                rolling_stats.add([value / num_players, *r_mean])
+                rolling_value, *rolling_values = rolling_stats.mean()
+                rolling_std, *rolling_stds = rolling_stats.stdev()
+
+                total_value += value
+                total_value_n += 1
+                avg_value = total_value / total_value_n / num_players
+
+                log_values = {
+                    "epoch": eval_ep,
+                    "eval_avg_value": value / num_players,
+                    "rolling_avg_value": rolling_value,
+                    "rolling_avg_std": rolling_std,
+                    "total_avg_value": avg_value,
+                }
+                for p in range(num_players):
+                    log_values.update(
+                        {
+                            f"mean_rewards_p{p}": r_mean[p],
+                            f"rolling_value_p{p}": rolling_values[p],
+                            f"rolling_std_p{p}": rolling_stds[p],
+                        }
+                    )
+                log.write(json.dumps(log_values) + "\n")
+
+                if compilation_cache and eval_ep + 1 == config.train.evaluate_every:
+                    # DQN training and evaluation have both been compiled (or loaded) by now
+                    compilation_cache.report()
+
+                print(
+                    f"[{eval_ep + 1}] Mean episode rewards {r_mean}, "
+                    f"avg_value: {value / num_players:.2f}, "
+                    f"total_avg_value: {avg_value:.2f}, "
+                    f"rolling_avg_value: {rolling_value:.2f}, "
+                    f"rolling_std: {rolling_std:.4f}"
                 )
-            if num_players > 3:
-                log_values.update(
-                    {
-                        "mean_rewards_p3": r_mean[3],
-                        "rolling_value_p3": rolling_value_p3,
-                        "rolling_std_p3": rolling_std_p3,
-                    }
+
+                if early_stopping and early_stopping.update(rolling_value, rolling_std):
+                    converged = True
+                    break
+            if converged:
+                # the agents are the ones the converged evaluation played
+                num_train_episodes = ep
+                print(
+                    f"rolling_avg_value converged after {ep} episodes, stopping training"
                 )
-            log.write(json.dumps(log_values) + "\n")
-
-            print(
-                f"[{ep + 1}] Mean episode rewards {r_mean}, "
-                f"avg_value: {value / num_players:.2f}, "
-                f"total_avg_value: {avg_value:.2f}, "
-                f"rolling_avg_value: {rolling_value:.2f}, "
-                f"rolling_std: {rolling_std:.4f}"
-            )
+                break
 
-        for agents in all_agents:
-            time_step = env.reset()
-            while not time_step.last():
-                player_id = time_step.observations["current_player"]
-                if env.is_turn_based:
-                    action_list = [get_action(rng, agents[player_id], env, time_step)]
-                else:
-                    action_list = [
-                        get_action(rng, agent, env, time_step) for agent in agents
-                    ]
-                time_step = env.step(action_list)
-
-            # Episode is over, step all DQN agents with final info state.
-            for agent in agents:
-                if isinstance(agent, rl_agent.AbstractAgent):
-                    agent.step(time_step)
+            if envs_per_seat > 1:
+                play_vectorized_training_episodes(rng, envs, learning_agents, exploitee)
+            else:
+                play_training_episodes(rng, envs, all_agents, exploitee)
 
     end_time = datetime.now()
     runtime_in_hours = (end_time - start_time).total_seconds() / 3600
 
-    print("appending to summary file")
+    if config.train.policy_cache_size:
+        print("training exploitee " + exploitee.format_stats())
 
-    # TODO update to handle more than 3 players
-    if num_players == 2:
-        summary_file.write(
-            "%s,%d,%d,%d,%d,%d,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.2f,%d,%.4f,%.4f,%.4f,%.4f\n"
-            % (
-                saved_agent_path,
-                config.agent_step,
-                config.train.num_train_episodes,
-                config.train.evaluate_every,
-                config.train.evaluate_num_episodes,
-                config.train.rolling_window_size,
-                config.train.dqn.learning_rate,
-                rolling_value,
-                avg_value,
-                rolling_value_p0,
-                rolling_value_p1,
-                -1,
-                runtime_in_hours,
-                config.train.dqn.replay_buffer_capacity,
-                rolling_std,
-                rolling_std_p0,
-                rolling_std_p1,
-                -1,
-            )
-        )
+    print("appending to summary file")
 
-    elif num_players == 3:
-        summary_file.write(
-            "%s,%d,%d,%d,%d,%d,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f,%.2f,%d,%.4f,%.4f,%.4f,%.4f\n"
-            % (
-                saved_agent_path,
-                config.agent_step,
-                config.train.num_train_episodes,
-                config.train.evaluate_every,
-                config.train.evaluate_num_episodes,
-                config.train.rolling_window_size,
-                config.train.dqn.learning_rate,
-                rolling_value,
-                avg_value,
-                rolling_value_p0,
-                rolling_value_p1,
-                rolling_value_p2,
-                runtime_in_hours,
-                config.train.dqn.replay_buffer_capacity,
-                rolling_std,
-                rolling_std_p0,
-                rolling_std_p1,
-                rolling_std_p2,
-            )
+    summary_file.write(
+        br_summary_row(
+            saved_agent_path,
+            config.agent_step,
+            num_train_episodes,
+            config.train.evaluate_every,
+            config.train.evaluate_num_episodes,
+            config.train.rolling_window_size,
+            config.train.dqn.learning_rate,
+            rolling_value,
+            avg_value,
+            rolling_values,
+            runtime_in_hours,
+            config.train.dqn.replay_buffer_capacity,
+            rolling_std,
+            rolling_stds,
         )
+        + "\n"
+    )
 
     output_agent_path = os.path.join(
         save_dir, config.io.output_agent_filename % config.agent_step
     )
-    print("writing %s to: %s" % (str(learning_agents[0]), output_agent_path))
-    with open(output_agent_path, "wb") as f:
-        cloudpickle.dump(learning_agents[0], f)
+    # every seat's agent, so later checkpoints can warm start from them
+    # written to a temporary file first, so a warm start never finds a partial file
+    print("writing the BR agents of every seat to: %s" % output_agent_path)
+    tmp_agent_path = output_agent_path + ".tmp"
+    try:
+        with open(tmp_agent_path, "wb") as f:
+            cloudpickle.dump(learning_agents, f)
+        os.replace(tmp_agent_path, output_agent_path)
+    finally:
+        if os.path.exists(tmp_agent_path):
+            os.remove(tmp_agent_path)
+    with open(
+        os.path.join(save_dir, config.io.agents_summary_file % config.agent_step), "w"
+    ) as f:
+        json.dump(agents_summary(learning_agents), f, indent=2)
 
 
 if __name__ == "__main__":
@@ -343,7 +885,7 @@ if __name__ == "__main__":
 
     summary = open(summary_file_path, "a")
     if add_header:
-        summary.write(BR_HEADER + "\n")
+        summary.write(br_header(config.game.num_players) + "\n")
 
     # initiate training
     train(config, save_dir, log, summary)
@@ -0,0 +1,195 @@
+import csv
+import fcntl
+import io
+import multiprocessing as mp
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from best_response_output import br_header
+from best_response_rl_multiplayer import train
+from config_schema import BestResponseConfig, BestResponseSweepConfig
+from exact_best_response import MAX_PLAYERS, evaluate_checkpoint
+from utils import dump_config, load_config
+
+# full solver pickles may have been evicted by checkpoint retention, the .npz are kept
+CHECKPOINT_PATTERN = re.compile(r"agent_(\d+)\.(pickle|npz)$")
+
+
+def checkpoint_steps(input_dir: str) -> list[int]:
+    steps = set()
+    for filename in os.listdir(input_dir):
+        m = CHECKPOINT_PATTERN.match(filename)
+        if m:
+            steps.add(int(m.group(1)))
+    return sorted(steps)
+
+
+def completed_steps(summary_path: str) -> set[int]:
+    """Checkpoints that already have a row in the summary file"""
+    if not os.path.isfile(summary_path):
+        return set()
+    with open(summary_path, newline="") as f:
+        return {int(row["checkpoint"]) for row in csv.DictReader(f)}
+
+
+def coverage_order(steps: list[int]) -> list[int]:
+    """`steps` ordered coarse to fine, so any prefix of the sweep spans the whole run.
+
+    The first and last steps come first, then the midpoints of the gaps between the steps
+    already taken, widest gaps first.
+    """
+    if len(steps) <= 2:
+        return list(steps)
+    order = [len(steps) - 1, 0]
+    gaps = [(0, len(steps) - 1)]
+    while gaps:
+        lo, hi = gaps.pop(0)
+        mid = (lo + hi) // 2
+        if mid in (lo, hi):
+            continue
+        order.append(mid)
+        gaps += [(lo, mid), (mid, hi)]
+    return [steps[ix] for ix in order]
+
+
+def append_summary(summary_path: str, num_players: int, rows: str):
+    """Appends `rows` to the summary file, adding the header if the file is new.
+
+    Holds an exclusive lock on the file while writing, so concurrent jobs (and separate
+    sweeps over the same input_dir) never interleave their rows.
+    """
+    with open(summary_path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            if os.fstat(f.fileno()).st_size == 0:
+                f.write(br_header(num_players) + "\n")
+            f.write(rows)
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+_cpu_slots = None
+
+
+def _init_worker(cpu_slots):
+    global _cpu_slots
+    _cpu_slots = cpu_slots
+
+
+def _run_checkpoint(
+    method: str, config: BestResponseConfig, save_dir: str, summary_path: str
+):
+    # pin this job to a free set of cores before jax starts its thread pools
+    cores = _cpu_slots.get()
+    start = time.time()
+    try:
+        os.sched_setaffinity(0, cores)
+        summary = io.StringIO()
+        if method == "exact":
+            evaluate_checkpoint(config, summary)
+        else:
+            log_path = os.path.join(save_dir, config.io.log_file % config.agent_step)
+            with open(log_path, "w") as log:
+                train(config, save_dir, log, summary)
+        append_summary(summary_path, config.game.num_players, summary.getvalue())
+        status = "done"
+    except Exception:
+        traceback.print_exc()
+        status = "failed"
+    finally:
+        _cpu_slots.put(cores)
+    return config.agent_step, status, time.time() - start
+
+
+def run_br_sweep(config: BestResponseSweepConfig) -> dict[int, str]:
+    """Best response of every checkpoint in the BR config's input_dir, one job each.
+
+    Checkpoints that already have a row in the summary file are skipped, so an interrupted
+    sweep picks up where it left off. Jobs run on a pool of `num_workers` processes, each
+    pinned to `cpus_per_worker` cores; returns the status of each job by step.
+    """
+    br_config = load_config(config.br_config, config_type="best_response")
+    if config.method == "dqn" and br_config.train.warm_start:
+        # jobs run concurrently and coarse to fine, so which earlier agents a job would warm
+        # start from would depend on which jobs happened to have finished
+        raise ValueError(
+            "warm_start isn't supported by br_sweep.py, run the checkpoints in order with "
+            "best_response_rl_multiplayer.py instead"
+        )
+    if config.method == "exact" and br_config.game.num_players > MAX_PLAYERS:
+        raise ValueError(
+            f"the exact best response only fits games of up to {MAX_PLAYERS} players"
+        )
+
+    cpus = sorted(os.sched_getaffinity(0))
+    if config.num_workers * config.cpus_per_worker > len(cpus):
+        raise ValueError(
+            f"{config.num_workers} workers x {config.cpus_per_worker} cpus "
+            f"don't fit on {len(cpus)} available cores"
+        )
+
+    save_dir = os.path.join(
+        br_config.io.output_dir, br_config.io.input_dir.replace("/", "_")
+    )
+    os.makedirs(save_dir, exist_ok=True)
+    dump_config(br_config, save_dir)
+
+    # each method has its own summary file, so one method's rows never mark a checkpoint as
+    # done for the other
+    if config.method == "exact":
+        summary_path = os.path.join(save_dir, br_config.io.exact_summary_file)
+    else:
+        summary_path = os.path.join(save_dir, br_config.io.summary_file)
+    done = completed_steps(summary_path)
+    steps = [
+        step
+        for step in checkpoint_steps(br_config.io.input_dir)
+        if (config.min_step is None or step >= config.min_step)
+        and (config.max_step is None or step <= config.max_step)
+        and step not in done
+    ]
+    print(
+        f"{len(steps)} checkpoints to evaluate in {br_config.io.input_dir} "
+        f"({len(done)} already in {summary_path})"
+    )
+
+    # one set of cores per worker, handed out to whichever job the worker picks up next
+    ctx = mp.get_context("spawn")
+    cpu_slots = ctx.Queue()
+    for worker in range(config.num_workers):
+        n = config.cpus_per_worker
+        cpu_slots.put(cpus[worker * n : (worker + 1) * n])
+
+    results = {}
+    with ProcessPoolExecutor(
+        config.num_workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(cpu_slots,),
+        max_tasks_per_child=1,
+    ) as pool:
+        futures = []
+        for step in coverage_order(steps):
+            step_config = br_config.model_copy(deep=True)
+            step_config.agent_step = step
+            futures.append(
+                pool.submit(
+                    _run_checkpoint, config.method, step_config, save_dir, summary_path
+                )
+            )
+
+        for future in as_completed(futures):
+            step, status, wall_time = future.result()
+            print(f"checkpoint {step} {status} in {wall_time / 3600:.2f} hrs")
+            results[step] = status
+    print(f"results written to {summary_path}")
+    return results
+
+
+if __name__ == "__main__":
+    config = load_config("../config_br_sweep.yaml", config_type="best_response_sweep")
+    run_br_sweep(config)
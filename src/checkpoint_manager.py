@@ -0,0 +1,76 @@
+import os
+import re
+
+import cloudpickle
+
+CHECKPOINT_PATTERN = re.compile(r"agent_(\d+)\.pickle$")
+
+
+class CheckpointManager:
+    """Indexes the full solver checkpoints (agent_{step}.pickle) of a run directory.
+
+    `load_latest` returns the newest checkpoint that loads, skipping unreadable ones. `add`
+    registers a newly written checkpoint and deletes the full solver pickles that fall out
+    of the retention policy: the newest `keep_last` are kept, plus milestones, the
+    checkpoints whose step + 1 is a multiple of `milestone_steps`. `keep_last=None` keeps
+    everything. The compact agent_{step}.npz policy files are small and always kept, so
+    every checkpoint can still be evaluated.
+    """
+
+    def __init__(
+        self,
+        save_dir: str,
+        keep_last: int | None = None,
+        milestone_steps: int | None = None,
+    ):
+        self.save_dir = save_dir
+        self.keep_last = keep_last
+        self.milestone_steps = milestone_steps
+        self._steps = sorted(self._index())
+
+    def _index(self):
+        for filename in os.listdir(self.save_dir):
+            m = CHECKPOINT_PATTERN.match(filename)
+            if m:
+                yield int(m.group(1))
+
+    def path(self, step: int) -> str:
+        return os.path.join(self.save_dir, f"agent_{step}.pickle")
+
+    @property
+    def steps(self) -> list[int]:
+        return list(self._steps)
+
+    def load_latest(self):
+        """(agent, step) of the newest checkpoint that loads, or None if there isn't one"""
+        for step in reversed(self._steps):
+            try:
+                with open(self.path(step), "rb") as f:
+                    return cloudpickle.load(f), step
+            except Exception as e:
+                print(f"skipping unreadable checkpoint {self.path(step)}: {e!r}")
+        return None
+
+    def is_milestone(self, step: int) -> bool:
+        return bool(self.milestone_steps) and (step + 1) % self.milestone_steps == 0
+
+    def add(self, step: int):
+        """Registers a written checkpoint and deletes the ones the retention policy evicts.
+
+        Called from CheckpointWriter's background thread, so deletion doesn't block training.
+        """
+        if step not in self._steps:
+            self._steps = sorted(self._steps + [step])
+        if self.keep_last is None:
+            return
+
+        recent = set(self._steps[-self.keep_last :])
+        evicted = [
+            s for s in self._steps if s not in recent and not self.is_milestone(s)
+        ]
+        for s in evicted:
+            try:
+                os.remove(self.path(s))
+            except FileNotFoundError:
+                pass
+        self._steps = [s for s in self._steps if s not in evicted]
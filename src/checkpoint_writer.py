@@ -0,0 +1,113 @@
+import os
+import queue
+import threading
+
+import cloudpickle
+import jax
+
+from policy_checkpoint import policy_metadata, save_policy_checkpoint
+
+
+class SolverSnapshot:
+    """Host-memory copy of an RNaDSolver's state that pickles exactly like the solver itself.
+
+    Loading a pickled snapshot with cloudpickle/pickle returns a regular RNaDSolver, so
+    existing consumers of agent_{step}.pickle files keep working unchanged.
+    """
+
+    def __init__(self, solver_cls, state):
+        self.solver_cls = solver_cls
+        self.state = state
+
+    def __reduce__(self):
+        # unpickling calls object.__new__(solver_cls) followed by __setstate__(state),
+        # which is how the solver itself is restored
+        return object.__new__, (self.solver_cls,), self.state
+
+
+def snapshot_agent(agent) -> SolverSnapshot:
+    # params and optimizer states are immutable jax arrays that agent.step() replaces rather
+    # than mutates, so copying them to host memory gives a consistent point-in-time snapshot
+    state = agent.__getstate__()
+    return SolverSnapshot(
+        type(agent),
+        {k: v if k == "config" else jax.device_get(v) for k, v in state.items()},
+    )
+
+
+class CheckpointWriter:
+    """Writes agent checkpoints from a background thread so the training loop isn't blocked.
+
+    Each checkpoint is written twice: agent_{step}.pickle holds the full solver for resuming
+    training, agent_{step}.npz the compact policy-only format read by the evaluation scripts.
+
+    `submit` only takes an in-memory snapshot; serialization and the file write happen on the
+    worker. At most `max_pending` snapshots are queued, after which `submit` waits for the
+    worker to catch up. Files are written to a temporary name and renamed when complete, so
+    a partially written checkpoint is never visible under its final name.
+    """
+
+    def __init__(self, save_dir: str, max_pending: int = 2, on_written=None):
+        os.makedirs(save_dir, exist_ok=True)
+        self.save_dir = save_dir
+        # called with the training step on the worker once both files of a checkpoint exist
+        self.on_written = on_written
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def submit(self, agent, training_step: int):
+        self._raise_if_failed()
+        self._queue.put((snapshot_agent(agent), policy_metadata(agent), training_step))
+
+    def close(self):
+        """Blocks until every submitted checkpoint is on disk."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_if_failed()
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise RuntimeError("background checkpoint write failed") from self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            snapshot, metadata, training_step = item
+            try:
+                self._write(
+                    f"agent_{training_step}.npz",
+                    lambda f: save_policy_checkpoint(
+                        f, snapshot.state["params_target"], metadata
+                    ),
+                )
+                self._write(
+                    f"agent_{training_step}.pickle",
+                    lambda f: cloudpickle.dump(snapshot, f),
+                )
+                if self.on_written is not None:
+                    self.on_written(training_step)
+            except Exception as e:
+                self._error = e
+
+    def _write(self, filename, write_fn):
+        output_file = os.path.join(self.save_dir, filename)
+        tmp_file = output_file + ".tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                write_fn(f)
+            os.replace(tmp_file, output_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
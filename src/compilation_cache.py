@@ -0,0 +1,155 @@
+import glob
+import hashlib
+import json
+import multiprocessing as mp
+import os
+
+import jax
+from jax import monitoring
+
+from config_schema import CompilationCacheSettings
+from policy_checkpoint import load_policy, read_policy_metadata
+from utils import load_config
+
+HIT_EVENT = "/jax/compilation_cache/cache_hits"
+MISS_EVENT = "/jax/compilation_cache/cache_misses"
+TIME_SAVED_EVENT = "/jax/compilation_cache/compile_time_saved_sec"
+
+
+class CompilationCache:
+    """Persistent on-disk cache of the programs JAX compiles, reused by later runs.
+
+    Each distinct `key` (network shapes, game config, batch sizes, ...) gets its own
+    subdirectory of `cache_dir`, so runs with different configs never evict each other's
+    entries and a directory can be deleted once its config is no longer used. Within a
+    directory JAX itself keys entries on the traced program, so a stale entry is never
+    loaded. Hits and misses are counted from JAX's monitoring events for `report`.
+    """
+
+    def __init__(self, cache_dir: str, key: dict):
+        self.key = key
+        digest = hashlib.sha256(
+            json.dumps(key, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        self.path = os.path.abspath(os.path.join(cache_dir, digest[:16]))
+
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+
+    def enable(self):
+        """Points JAX at the cache; call before anything is compiled.
+
+        JAX decides whether to use the persistent cache at its first compilation and keeps
+        that answer for the rest of the process, so enabling it any later has no effect.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        self.existing_entries = len(
+            [f for f in os.listdir(self.path) if f != "key.json"]
+        )
+        with open(os.path.join(self.path, "key.json"), "w") as f:
+            json.dump(self.key, f, indent=2, sort_keys=True)
+
+        jax.config.update("jax_compilation_cache_dir", self.path)
+        # the defaults skip programs that compile in under a second, which is most of ours
+        jax.config.update("jax_persistent_cache_min_compile_time_secs", 0)
+        jax.config.update("jax_persistent_cache_min_entry_size_bytes", 0)
+
+        monitoring.register_event_listener(self._on_event)
+        monitoring.register_event_duration_secs_listener(self._on_duration)
+        return self
+
+    def _on_event(self, event, **kwargs):
+        if event == HIT_EVENT:
+            self.hits += 1
+        elif event == MISS_EVENT:
+            self.misses += 1
+
+    def _on_duration(self, event, duration, **kwargs):
+        if event == TIME_SAVED_EVENT:
+            self.time_saved += duration
+
+    def report(self):
+        print(
+            f"JAX compilation cache {self.path}: {self.hits} hits, "
+            f"{self.misses} misses, {self.time_saved:.1f} sec compile time saved"
+        )
+        if self.existing_entries and self.misses and not self.hits:
+            print(
+                f"warning: none of the {self.existing_entries} entries cached by earlier "
+                "runs were used; was anything compiled before the cache was enabled?"
+            )
+
+
+def policy_cache_key(metadata: dict) -> dict:
+    """The parts of a policy checkpoint's metadata that determine its compiled network"""
+    return {
+        key: metadata[key]
+        for key in (
+            "game_params",
+            "num_actions",
+            "state_representation",
+            "policy_network_layers",
+            "policy_threshold",
+            "policy_discretization",
+        )
+    }
+
+
+def checkpoint_cache_key(path: str) -> dict:
+    """policy_cache_key of the checkpoint at `path`, without loading the checkpoint.
+
+    Unpickling a full solver compiles its networks, so the cache has to be enabled first.
+    A pickle's metadata is read from any .npz checkpoint of the same run, and failing that
+    the run's directory is the key, since all of a run's checkpoints share their network.
+    """
+    if os.path.splitext(path)[1] != ".npz":
+        run_dir = os.path.dirname(os.path.abspath(path))
+        npz_paths = sorted(glob.glob(os.path.join(run_dir, "agent_*.npz")))
+        if not npz_paths:
+            return {"run_dir": run_dir}
+        path = npz_paths[0]
+    return policy_cache_key(read_policy_metadata(path))
+
+
+def enable_compilation_cache(
+    settings: CompilationCacheSettings, key: dict
+) -> CompilationCache | None:
+    if not settings.enabled:
+        return None
+    return CompilationCache(settings.cache_dir, key).enable()
+
+
+def _load_and_count(settings: CompilationCacheSettings, checkpoint_path: str):
+    # what the BR and play scripts do: enable the cache, load the checkpoint, run the policy
+    cache = CompilationCache(
+        settings.cache_dir,
+        {"script": "check", "policy": checkpoint_cache_key(checkpoint_path)},
+    ).enable()
+    agent = load_policy(checkpoint_path)
+    state = agent._game.new_initial_state()
+    while state.is_chance_node():
+        state.apply_action(state.chance_outcomes()[0][0])
+    agent.action_probabilities(state)
+    return cache.hits, cache.misses
+
+
+def check_cache_hits(settings: CompilationCacheSettings, checkpoint_path: str) -> bool:
+    """Loads the checkpoint in two fresh processes; the second should hit the cache"""
+    ctx = mp.get_context("spawn")
+    runs = []
+    for _ in range(2):
+        with ctx.Pool(1) as pool:
+            runs.append(pool.apply(_load_and_count, (settings, checkpoint_path)))
+    for run, (hits, misses) in enumerate(runs, 1):
+        print(f"run {run}: {hits} hits, {misses} misses")
+    return runs[1][0] > 0
+
+
+if __name__ == "__main__":
+    config = load_config("../config_play_agents.yaml", config_type="play_agents")
+    settings = config.compilation_cache.model_copy(update={"enabled": True})
+    path = os.path.join(config.agent_path, config.agent_filename)
+    if not check_cache_hits(settings, path):
+        raise SystemExit(f"the second load of {path} didn't hit the compilation cache")
+    print("the compilation cache is used")
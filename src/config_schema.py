@@ -1,4 +1,4 @@
-from typing import List, Literal, Tuple
+from typing import Any, Dict, List, Literal, Tuple
 
 from pydantic import BaseModel
 
@@ -11,6 +11,13 @@ class GameSettings(BaseModel):
     num_players: int = 3
 
 
+class CompilationCacheSettings(BaseModel):
+    # compiled JAX programs are kept in a subdirectory of cache_dir per network/game config
+    # and reused by later runs with the same config
+    enabled: bool = True
+    cache_dir: str = "jax_cache/"
+
+
 ### Training Settings ###
 
 
@@ -23,13 +30,35 @@ class RNaDConfig(BaseModel):
 class TrainSettings(BaseModel):
     training_steps: int = 1_000_000
     checkpoint_frequency: int = 10_000
+    # loss/step time stats cover the last report_frequency steps and are written to
+    # metrics.jsonl in the run directory every report_frequency steps
+    report_frequency: int = 1_000
+    # actor/learner mode: num_actors processes generate trajectories while the main process
+    # runs the updates; 0 keeps the single-process agent.step() loop
+    num_actors: int = 0
+    param_sync_frequency: int = 1  # learner steps between sending params to the actors
+    max_queued_trajectories: int = 4  # actors wait once this many batches are queued
+    # play each trajectory batch on the batched NumPy game instead of pyspiel states
+    vectorized_rollouts: bool = False
+    # opt-in: time the rollout, batching, device transfer and learner update phases of each
+    # step, reported with the other metrics; this adds a little synchronization overhead
+    profile: bool = False
+    # with profile, write a jax profiler trace of trace_num_steps steps from trace_start_step
+    trace_start_step: int | None = None
+    trace_num_steps: int = 10
     rnad: RNaDConfig
 
 
 class IOSettings(BaseModel):
     run_id: str = "test"
     load_checkpoint: str | None = None  # filename only; will look in save_dir/run_id/
+    # without load_checkpoint, continue an existing run_id from its newest readable checkpoint
+    resume: bool = False
     save_dir: str = "checkpoints/"
+    # retention of full agent_{step}.pickle checkpoints (agent_{step}.npz files are kept):
+    # keep the newest keep_last_checkpoints (None keeps all), plus every milestone_every-th
+    keep_last_checkpoints: int | None = None
+    milestone_every: int | None = None
 
 
 class TrainConfig(BaseModel):
@@ -38,6 +67,52 @@ class TrainConfig(BaseModel):
     game: GameSettings
     train: TrainSettings
     io: IOSettings
+    compilation_cache: CompilationCacheSettings = CompilationCacheSettings()
+
+
+### Sweep Settings ###
+
+
+class SweepConfig(BaseModel):
+    sweep_id: str = "sweep"  # runs are saved in {base io.save_dir}/{sweep_id}/run_{n}
+    base_config: str = "../config.yaml"  # training config every run starts from
+    # full agent_{step}.pickle every run is forked from; None trains every run from scratch
+    base_checkpoint: str | None = None
+    training_steps: int | None = (
+        None  # overrides train.training_steps of the base config
+    )
+
+    # RNaDConfig fields to vary: grid search runs every combination of the listed values,
+    # random search draws each field from its list for every one of num_samples runs
+    search: Literal["grid", "random"] = "grid"
+    parameters: Dict[str, List[Any]] = {}
+    # random search only: fields drawn log-uniformly from [low, high]
+    log_uniform: Dict[str, Tuple[float, float]] = {}
+    num_samples: int = 10
+    seed: int = 0
+
+    num_workers: int = 2  # runs trained at the same time
+    cpus_per_worker: int = 1  # each run is pinned to its own set of this many cores
+
+
+### Benchmark Settings ###
+
+
+class BenchmarkGridSettings(BaseModel):
+    # every combination of these values is benchmarked
+    game: List[GameSettings] = [GameSettings()]
+    batch_size: List[int] = [256]
+    trajectory_max: List[int] = [15]
+    policy_network_layers: List[Tuple[int, int]] = [(256, 256)]
+    vectorized_rollouts: List[bool] = [False]
+
+
+class BenchmarkConfig(BaseModel):
+    warmup_steps: int = 5  # the first warm-up step includes compilation
+    measured_steps: int = 50
+    seed: int = 42
+    output_dir: str = "benchmark_output/"
+    grid: BenchmarkGridSettings
 
 
 ### Best Response Evaluation Settings ###
@@ -59,10 +134,38 @@ class BestResponseTrainSettings(BaseModel):
     num_train_episodes: int = 1_000_000
     evaluate_every: int = 5000
     evaluate_num_episodes: int = 1000
+    # evaluation runs in eval_num_workers processes alongside training (0 evaluates in this
+    # process, pausing training); each seat's episodes are split into eval_shards_per_seat
+    # shards, seeded so results are reproducible for a given seed and any number of workers
+    eval_num_workers: int = 0
+    eval_shards_per_seat: int = 4
+    # games a shard plays concurrently, so the exploitee's decisions are batched
+    eval_concurrent_envs: int = 32
+    # "stratified" cycles each seat's evaluation episodes through every possible deal
+    # (num_digits ** (num_players * hand_length) of them) instead of dealing at random, so
+    # with a multiple of that many episodes the deals' expectation is exact (with fewer, the
+    # deals are sampled without replacement); above 10 million deals, random deals are used
+    eval_deals: Literal["random", "stratified"] = "random"
+    # every evaluation replays the same deals and random draws, so differences between
+    # evaluations come from the BR agents alone
+    eval_common_random_numbers: bool = False
+    # the exploitee's policy is memoized for this many information states (None disables)
+    policy_cache_size: int | None = 200_000
+    # training episodes per seat played in lockstep; above 1, each DQN agent's decisions
+    # across them are one batched forward pass and their transitions are added together
+    train_envs_per_seat: int = 1
 
     # rolling window captures this many eval train episodes,
     # ie the number of episodes in a window is rolling_window_size * evaluate_every
     rolling_window_size: int = 10
+    # start the DQN agents from the BR agents saved for the nearest earlier checkpoint
+    warm_start: bool = False
+    # optional early stopping: training ends once, for early_stopping_patience consecutive
+    # evaluations (with a full rolling window), rolling_avg_value moved by at most
+    # early_stopping_tolerance and rolling_std is at most early_stopping_max_std
+    early_stopping_patience: int | None = None
+    early_stopping_tolerance: float = 0.005
+    early_stopping_max_std: float = 0.02
 
     dqn: BestResponseNetworkSettings
 
@@ -72,19 +175,41 @@ class BestResponseIOSettings(BaseModel):
     output_dir: str = (
         "best_response_output/"  # custom subdir using input_dir will be auto created
     )
+    # the BR agents of every seat, and a JSON summary of their training and replay buffers
     output_agent_filename: str = "best_response_agent_%d.pickle"
+    agents_summary_file: str = "best_response_agent_%d.json"
     log_file: str = "best_response_agent_%d.log"  # eval logs, will be in output_dir
     summary_file: str = (
         "summary.txt"  # output final BR agent's performance, will be in output_dir
     )
+    # the exact best response's rows, kept apart from the DQN best response's
+    exact_summary_file: str = "exact_summary.txt"
 
 
 class BestResponseConfig(BaseModel):
-    agent_step: int  # specify the checkpoint number, conforming with io.input_dir/agent_%d.pickle
+    agent_step: int  # specify the checkpoint number, conforming with io.input_dir/agent_%d.npz or .pickle
 
     game: GameSettings
     train: BestResponseTrainSettings
     io: BestResponseIOSettings
+    compilation_cache: CompilationCacheSettings = CompilationCacheSettings()
+    # node budget of the exact best response (exact_best_response.py), which only fits small
+    # 2-player games (3x3 is 29,054,391 nodes)
+    exact_max_nodes: int | None = 50_000_000
+
+
+class BestResponseSweepConfig(BaseModel):
+    br_config: str = (
+        "../config_br.yaml"  # BR settings every checkpoint is evaluated with
+    )
+    method: Literal["dqn", "exact"] = "dqn"  # exact only fits small 2-player games
+    # checkpoints of br_config's io.input_dir to evaluate; None evaluates all of them
+    min_step: int | None = None
+    max_step: int | None = None
+
+    num_workers: int = 2  # checkpoints evaluated at the same time
+    # each job is pinned to its own set of this many cores, shared with its eval workers
+    cpus_per_worker: int = 1
 
 
 ### Play Interactive Settings ###
@@ -95,6 +220,7 @@ class PlayInteractiveConfig(BaseModel):
     agent_filename: str
     debug: bool = False
     output_dir: str = "play_output/interactive"
+    compilation_cache: CompilationCacheSettings = CompilationCacheSettings()
 
 
 ### Play Agents Settings
@@ -111,3 +237,6 @@ class PlayAgentsConfig(BaseModel):
 
     open_ai_api_key: str | None = None
     open_ai_model: str = "o3"
+    # the agent's policy is memoized for this many information states (None disables)
+    policy_cache_size: int | None = 200_000
+    compilation_cache: CompilationCacheSettings = CompilationCacheSettings()
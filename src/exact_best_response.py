@@ -0,0 +1,284 @@
+import itertools
+import os
+from datetime import datetime
+
+import numpy as np
+from open_spiel.python.algorithms.rnad import rnad
+
+from best_response_output import br_header, br_summary_row
+from compilation_cache import checkpoint_cache_key, enable_compilation_cache
+from config_schema import BestResponseConfig
+from policy_checkpoint import find_checkpoint, load_policy
+from utils import dump_config, load_config
+from vector_env import BID_ACTION_OFFSET, VectorLiarsPoker
+
+# the public tree can't merge histories, so it grows far too fast with more players: 3x3
+# with 2 players is about 29 million nodes, with 3 players about 1.6e15
+MAX_PLAYERS = 2
+
+
+class ExactBestResponse:
+    """Exact best response values against a fixed policy, by traversing the game tree once.
+
+    Every hand is equally likely and each player only observes their own, so instead of
+    dealing, the traversal walks the public tree (the bids and challenges) and carries each
+    exploitee's reach probability for all of their possible hands. Nodes are expanded a
+    batch at a time on VectorLiarsPoker: the exploitee's policy for every hand at every node
+    of a batch is one forward pass, and at the BR player's nodes each of their hands takes
+    its best action. Subtrees that no exploitee hand reaches are skipped.
+
+    The exploitee's info state holds the full bid history, so no two public histories can
+    be merged and the tree grows exponentially with the number of bids. This is only
+    practical for small 2-player games: 3x3 with 2 players is 29,054,391 nodes, about 14
+    minutes per seat, while 3 players would be about 1.6e15 nodes. `max_nodes` bounds the
+    traversal.
+    """
+
+    def __init__(
+        self,
+        inference_policy,
+        max_nodes: int | None = None,
+        batch_size: int = 2048,
+    ):
+        self.policy = inference_policy
+        self.max_nodes = max_nodes
+        self.batch_size = batch_size
+        game = inference_policy._game
+        self.num_players = game.num_players()
+        self.hand_length = game.hand_length
+        self.num_nodes = 0
+
+        # the public tree is played with placeholder hands, which only the tensors would
+        # see; they're replaced with every possible hand of the player to act
+        self._root = VectorLiarsPoker.from_game(game, num_games=1)
+        self._root.reset(np.zeros((1, self.num_players, self.hand_length)))
+        # every ordered hand, in the order they're dealt; the policy sees the order
+        self.hands = np.array(
+            list(itertools.product(self._root.deck, repeat=game.hand_length))
+        )
+        self.num_hands = len(self.hands)
+        # matches[h, n - 1]: how many of digit n hand h holds
+        self.matches = np.stack(
+            [
+                (self.hands == n).sum(axis=1)
+                for n in range(1, self._root.num_digits + 1)
+            ],
+            axis=1,
+        )
+        self._hand_slice = slice(self.num_players, self.num_players + self.hand_length)
+        if inference_policy.metadata["state_representation"] == str(
+            rnad.StateRepresentation.OBSERVATION.value
+        ):
+            # the observation tensor is the information state tensor without the history
+            self._tensor_size = self.num_players + self.hand_length + 2
+        else:
+            self._tensor_size = self._root.information_state_tensor_size
+
+    def _policy_matrices(self, games) -> np.ndarray:
+        """The acting player's policy [B, num_hands, num_actions] for each of their hands"""
+        obs = np.repeat(
+            games.information_state_tensor()[:, None, : self._tensor_size],
+            self.num_hands,
+            axis=1,
+        )
+        obs[:, :, self._hand_slice] = self.hands
+        legal = np.repeat(games.legal_actions_mask()[:, None], self.num_hands, axis=1)
+        probs = self.policy.policy_matrix(
+            obs.reshape(-1, self._tensor_size), legal.reshape(-1, legal.shape[-1])
+        )
+        return probs.reshape(games.num_games, self.num_hands, -1)
+
+    def _terminal_values(self, games, reach, br_player) -> np.ndarray:
+        """BR player's payoff for each of their hands, weighted by the exploitees' reach"""
+        bid = games.current_action - BID_ACTION_OFFSET
+        count = bid // games.num_digits + 1
+        matches = self.matches[:, bid % games.num_digits].T  # [B, num_hands]
+
+        # distribution of the exploitees' total matches, weighted by their reach
+        num_games = len(bid)
+        weights = np.ones((num_games, 1))
+        for player in range(self.num_players):
+            if player == br_player:
+                continue
+            player_weights = np.zeros((num_games, self.hand_length + 1))
+            np.add.at(
+                player_weights,
+                (np.arange(num_games)[:, None], matches),
+                reach[:, player],
+            )
+            total = np.zeros((num_games, weights.shape[1] + self.hand_length))
+            for c in range(self.hand_length + 1):
+                total[:, c : c + weights.shape[1]] += (
+                    weights * player_weights[:, c, None]
+                )
+            weights = total
+
+        # mass of the exploitee hands with at least k matches, for every k
+        at_least = np.concatenate(
+            [np.cumsum(weights[:, ::-1], axis=1)[:, ::-1], np.zeros((num_games, 1))],
+            axis=1,
+        )
+        needed = np.clip(count[:, None] - matches, 0, weights.shape[1])
+        success = np.take_along_axis(at_least, needed, axis=1)
+        failure = weights.sum(axis=1, keepdims=True) - success
+
+        is_bidder = (games.bid_originator == br_player)[:, None]
+        return np.where(
+            is_bidder,
+            (self.num_players - 1) * (success - failure),
+            failure - success,
+        )
+
+    def _values(self, games, reach, br_player) -> np.ndarray:
+        """BR player's values [B, num_hands] at a batch of public nodes"""
+        self.num_nodes += games.num_games
+        if self.max_nodes is not None and self.num_nodes > self.max_nodes:
+            raise RuntimeError(
+                f"exact best response exceeded max_nodes={self.max_nodes}; "
+                "the game is too large, use the DQN best response instead"
+            )
+        values = np.zeros((games.num_games, self.num_hands))
+        terminal = games.is_terminal()
+        if terminal.any():
+            ix = np.flatnonzero(terminal)
+            values[ix] = self._terminal_values(games.take(ix), reach[ix], br_player)
+
+        legal = games.legal_actions_mask().astype(bool)
+        legal[terminal] = False
+        parent, action = np.nonzero(legal)
+        child_reach = reach[parent]
+
+        # the exploitees follow their policy; drop the actions none of their hands take
+        player = games.current_player()[parent]
+        exploitee = player != br_player
+        if exploitee.any():
+            ix = np.flatnonzero(~terminal & (games.current_player() != br_player))
+            probs = self._policy_matrices(games.take(ix))
+            position = np.zeros(games.num_games, dtype=np.int64)
+            position[ix] = np.arange(len(ix))
+
+            e = np.flatnonzero(exploitee)
+            child_reach[e, player[e]] *= probs[position[parent[e]], :, action[e]]
+            keep = ~exploitee | child_reach[np.arange(len(parent)), player].any(axis=1)
+            parent, action, child_reach = parent[keep], action[keep], child_reach[keep]
+            exploitee = exploitee[keep]
+
+        if len(parent) == 0:
+            return values
+
+        children = games.take(parent)
+        children.step(action)
+        child_values = np.concatenate(
+            [
+                self._values(
+                    children.take(
+                        np.arange(start, min(start + self.batch_size, len(parent)))
+                    ),
+                    child_reach[start : start + self.batch_size],
+                    br_player,
+                )
+                for start in range(0, len(parent), self.batch_size)
+            ]
+        )
+
+        # the exploitees' actions add up, the BR player picks the best one for each hand
+        np.add.at(values, parent[exploitee], child_values[exploitee])
+        br_values = np.full_like(values, -np.inf)
+        np.maximum.at(br_values, parent[~exploitee], child_values[~exploitee])
+        br_nodes = np.isfinite(br_values[:, 0])
+        values[br_nodes] = br_values[br_nodes]
+        return values
+
+    def value(self, br_player: int) -> float:
+        """Expected payoff of a best response in seat `br_player`"""
+        reach = np.full((1, self.num_players, self.num_hands), 1 / self.num_hands)
+        values = self._values(self._root, reach, br_player)
+        return float(values.mean())
+
+    def values(self) -> list[float]:
+        return [self.value(player) for player in range(self.num_players)]
+
+
+def exploitability(br_values) -> float:
+    """Mean BR value over the seats; the game is zero-sum, so the policy itself scores 0"""
+    return sum(br_values) / len(br_values)
+
+
+def evaluate_checkpoint(config: BestResponseConfig, summary_file):
+    """Exact BR values of the checkpoint at config.agent_step, appended to the summary file
+
+    The row has the same columns as the DQN best response's: the BR values are exact, so
+    the rolling and total values are the same, the stds are 0 and the training fields are 0.
+    """
+    if config.game.num_players > MAX_PLAYERS:
+        raise ValueError(
+            f"the exact best response only fits games of up to {MAX_PLAYERS} players, "
+            f"use the DQN best response for {config.game.num_players} players"
+        )
+    saved_agent_path = find_checkpoint(config.io.input_dir, config.agent_step)
+    compilation_cache = enable_compilation_cache(
+        config.compilation_cache,
+        {
+            "script": "exact_best_response",
+            "exploitee": checkpoint_cache_key(saved_agent_path),
+        },
+    )
+    print("loading agent from: %s" % saved_agent_path)
+    exploitee = load_policy(saved_agent_path)
+    if exploitee.metadata["game_params"] != config.game.model_dump():
+        raise ValueError(
+            f"checkpoint game {exploitee.metadata['game_params']} doesn't match the config"
+        )
+
+    start_time = datetime.now()
+    engine = ExactBestResponse(exploitee, config.exact_max_nodes)
+    br_values = engine.values()
+    value = exploitability(br_values)
+    runtime_in_hours = (datetime.now() - start_time).total_seconds() / 3600
+    print(
+        f"BR values {np.round(br_values, 4)}, exploitability: {value:.4f} "
+        f"({engine.num_nodes} nodes)"
+    )
+    if compilation_cache:
+        compilation_cache.report()
+
+    summary_file.write(
+        br_summary_row(
+            saved_agent_path,
+            config.agent_step,
+            0,
+            0,
+            0,
+            0,
+            0,
+            value,
+            value,
+            br_values,
+            runtime_in_hours,
+            0,
+            0,
+            [0] * len(br_values),
+        )
+        + "\n"
+    )
+    return br_values
+
+
+if __name__ == "__main__":
+    config = load_config("../config_br.yaml", config_type="best_response")
+
+    # set up IO
+    save_dir = os.path.join(config.io.output_dir, config.io.input_dir.replace("/", "_"))
+    if not os.path.isdir(save_dir):
+        os.mkdir(save_dir)
+
+    dump_config(config, save_dir)
+
+    # summary file keeps track of the results across various agent_steps
+    summary_file_path = os.path.join(save_dir, config.io.exact_summary_file)
+    add_header = not os.path.isfile(summary_file_path)
+
+    with open(summary_file_path, "a") as summary:
+        if add_header:
+            summary.write(br_header(config.game.num_players) + "\n")
+        evaluate_checkpoint(config, summary)
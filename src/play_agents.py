@@ -2,7 +2,6 @@ import datetime
 import os
 import re
 
-import cloudpickle
 import pyspiel
 from numpy.random import default_rng
 from openai import OpenAI
@@ -12,12 +11,15 @@ from setup_logs import get_logger
 
 rng = default_rng()
 from baseline import BaselineModel
+from compilation_cache import checkpoint_cache_key, enable_compilation_cache
 from llm_inputs import (
     instructions_reminder,
     liars_poker_instructions_2players,
     liars_poker_instructions_3players,
     liars_poker_rules,
 )
+from policy_cache import cached_policy
+from policy_checkpoint import load_policy
 from utils import dump_config, load_config
 
 
@@ -697,8 +699,11 @@ def main(config: PlayAgentsConfig):
     if not os.path.isfile(agent_full_path):
         raise ValueError(f"Could not find agent at {agent_full_path}")
 
-    with open(agent_full_path, "rb") as f:
-        agent = cloudpickle.load(f)
+    # before loading, which compiles a pickled solver's networks
+    compilation_cache = enable_compilation_cache(
+        config.compilation_cache, checkpoint_cache_key(agent_full_path)
+    )
+    agent = cached_policy(load_policy(agent_full_path), config.policy_cache_size)
 
     batch = AllRounds(config, agent)
 
@@ -708,17 +713,22 @@ def main(config: PlayAgentsConfig):
         "total_counts": "none",
         "player_counts": {},
     }
-    for _ in range(config.n_rounds):
+    for round_ix in range(config.n_rounds):
         this_round = batch.play_next_round(
             prev_round["final_bidder"],
             prev_round["result"],
             prev_round["total_counts"],
             prev_round["player_counts"],
         )
+        if compilation_cache and round_ix == 0:
+            compilation_cache.report()
         if this_round["result"] != "failed":
             prev_round = this_round
             batch.print_equity_and_counts()
 
+    if config.policy_cache_size:
+        log.info(agent.format_stats())
+
 
 if __name__ == "__main__":
     config = load_config("../config_play_agents.yaml", config_type="play_agents")
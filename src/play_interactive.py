@@ -2,11 +2,12 @@ import logging
 import os
 from typing import List, Literal
 
-import cloudpickle
 import numpy as np
 import pyspiel
 from open_spiel.python import games  # pylint: disable=unused-import
 
+from compilation_cache import checkpoint_cache_key, enable_compilation_cache
+from policy_checkpoint import load_policy
 from setup_logs import get_logger
 from utils import dump_config, load_config
 
@@ -314,8 +315,11 @@ class LiarsPokerGame:
 
 def main():
 
-    with open(agent_full_path, "rb") as f:
-        agent = cloudpickle.load(f)
+    # before loading, which compiles a pickled solver's networks
+    compilation_cache = enable_compilation_cache(
+        config.compilation_cache, checkpoint_cache_key(agent_full_path)
+    )
+    agent = load_policy(agent_full_path)
 
     game = pyspiel.load_game(
         "python_liars_poker",
@@ -361,6 +365,10 @@ def main():
             continue
 
         starting_player = liars_poker_game.play_game(starting_player, ai_hand)
+        if compilation_cache:
+            # only reported once, the AI's network is compiled during the first game
+            compilation_cache.report()
+            compilation_cache = None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+import collections
+
+import numpy as np
+from open_spiel.python import policy
+
+
+class CachedPolicy(policy.Policy):
+    """Memoizes the action probabilities of an InferencePolicy by information state.
+
+    The small games have a limited set of information states, which come up over and over in
+    BR training and automated play. Entries are keyed by the bytes of the state tensor and
+    legal action mask, and the least recently used one is evicted once `max_size` entries
+    are stored. Batched lookups only run the network on the rows that missed.
+    """
+
+    def __init__(self, inference_policy, max_size: int):
+        super().__init__(inference_policy.game, inference_policy.player_ids)
+        self.policy = inference_policy
+        self.metadata = inference_policy.metadata
+        self._game = inference_policy._game
+        self.max_size = max_size
+        self._cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def policy_matrix(self, obs, legal) -> np.ndarray:
+        obs = np.asarray(obs, dtype=np.float32)
+        legal = np.asarray(legal, dtype=np.int8)
+        keys = [o.tobytes() + m.tobytes() for o, m in zip(obs, legal)]
+
+        probs = np.empty(legal.shape, dtype=np.float32)
+        missed = {}  # key -> rows, so repeats within a batch are computed once
+        for ix, key in enumerate(keys):
+            row = self._cache.get(key)
+            if row is None:
+                missed.setdefault(key, []).append(ix)
+            else:
+                self._cache.move_to_end(key)
+                probs[ix] = row
+        self.hits += len(keys) - len(missed)
+        self.misses += len(missed)
+
+        if missed:
+            rows = [ixs[0] for ixs in missed.values()]
+            computed = self.policy.policy_matrix(obs[rows], legal[rows])
+            for (key, ixs), row in zip(missed.items(), computed):
+                probs[ixs] = row
+                self._cache[key] = row
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return probs
+
+    def states_policy_matrix(self, states) -> np.ndarray:
+        obs = np.array(
+            [self.policy._state_tensor(state) for state in states], dtype=np.float32
+        )
+        legal = np.array(
+            [state.legal_actions_mask() for state in states], dtype=np.int8
+        )
+        return self.policy_matrix(obs, legal)
+
+    def action_probabilities(self, state, player_id=None):
+        probs = self.states_policy_matrix([state])[0]
+        legal = state.legal_actions_mask()
+        return {action: probs[action] for action, valid in enumerate(legal) if valid}
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "size": len(self._cache),
+        }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        hit_rate = f"{stats['hit_rate']:.1%}" if stats["hit_rate"] is not None else "-"
+        return (
+            f"policy cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({hit_rate} hit rate), {stats['size']}/{self.max_size} entries"
+        )
+
+
+def cached_policy(inference_policy, max_size: int | None):
+    """`inference_policy` behind a CachedPolicy, or unchanged if caching is off (no size)"""
+    if not max_size:
+        return inference_policy
+    return CachedPolicy(inference_policy, max_size)
@@ -0,0 +1,293 @@
+import json
+import os
+from multiprocessing import shared_memory
+
+import cloudpickle
+import haiku as hk
+import jax
+import numpy as np
+import pyspiel
+from open_spiel.python import games  # pylint: disable=unused-import
+from open_spiel.python import policy
+from open_spiel.python.algorithms.rnad import rnad
+
+# version 1: torso + policy head of RNaDSolver.params_target as named float32 arrays,
+# plus a JSON metadata header stored under METADATA_KEY
+FORMAT_VERSION = 1
+METADATA_KEY = "__metadata__"
+
+# haiku module names of the RNaD network: "mlp" is the torso, "mlp_1" the policy head and
+# "mlp_2" the value head, which isn't needed for inference
+POLICY_MODULES = ("mlp/", "mlp_1/")
+
+# float32 elements per 64 bytes: jax's CPU backend uses 64-byte aligned host arrays in place
+# instead of copying them
+SHARED_ALIGNMENT = 16
+
+
+def policy_metadata(agent) -> dict:
+    """Small header describing everything needed to rebuild the policy network of `agent`"""
+    game_params = agent._game.get_parameters()
+    return {
+        "format_version": FORMAT_VERSION,
+        "game_name": agent.config.game_name,
+        "game_params": {
+            "num_digits": game_params["num_digits"],
+            "hand_length": game_params["hand_length"],
+            "num_players": game_params["players"],
+        },
+        "num_actions": agent._game.num_distinct_actions(),
+        "state_representation": str(agent.config.state_representation.value),
+        "policy_network_layers": [int(x) for x in agent.config.policy_network_layers],
+        "policy_threshold": float(agent.config.finetune.policy_threshold),
+        "policy_discretization": int(agent.config.finetune.policy_discretization),
+        "learner_steps": int(agent.learner_steps),
+        "actor_steps": int(agent.actor_steps),
+    }
+
+
+def flatten_params(params) -> dict:
+    # {"mlp/~/linear_0": {"w": ..., "b": ...}} -> {"mlp/~/linear_0/w": ...}
+    return {
+        f"{module}/{name}": np.asarray(value, dtype=np.float32)
+        for module, module_params in params.items()
+        if module.startswith(POLICY_MODULES)
+        for name, value in module_params.items()
+    }
+
+
+def unflatten_params(arrays) -> dict:
+    params = {}
+    for key, value in arrays.items():
+        module, name = key.rsplit("/", 1)
+        params.setdefault(module, {})[name] = value
+    return params
+
+
+def save_policy_checkpoint(file, params, metadata: dict):
+    """Writes the policy params and metadata header as an .npz archive to an open file"""
+    arrays = flatten_params(params)
+    arrays[METADATA_KEY] = np.frombuffer(
+        json.dumps(metadata).encode("utf-8"), dtype=np.uint8
+    )
+    np.savez(file, **arrays)
+
+
+def _read_metadata(data, path: str) -> dict:
+    metadata = json.loads(data[METADATA_KEY].tobytes().decode("utf-8"))
+    if metadata.get("format_version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported policy checkpoint version {metadata.get('format_version')} in {path}"
+        )
+    return metadata
+
+
+def read_policy_metadata(path: str) -> dict:
+    """The metadata header of an .npz checkpoint, without loading its params"""
+    with np.load(path, allow_pickle=False) as data:
+        return _read_metadata(data, path)
+
+
+def load_policy_checkpoint(path: str):
+    with np.load(path, allow_pickle=False) as data:
+        metadata = _read_metadata(data, path)
+        params = unflatten_params({k: data[k] for k in data.files if k != METADATA_KEY})
+    return params, metadata
+
+
+class InferencePolicy(policy.Policy):
+    """The policy network of a trained RNaDSolver, without the optimizers and learner.
+
+    Produces the same action probabilities as RNaDSolver.action_probabilities, ie the
+    post-processed (thresholded and discretized) policy of params_target.
+    """
+
+    def __init__(self, params, metadata: dict):
+        self.metadata = metadata
+        self._game = pyspiel.load_game(metadata["game_name"])
+        super().__init__(self._game, list(range(self._game.num_players())))
+
+        self.params = jax.device_put(params)
+        self._finetune = rnad.FineTuning(
+            policy_threshold=metadata["policy_threshold"],
+            policy_discretization=metadata["policy_discretization"],
+        )
+
+        layers = metadata["policy_network_layers"]
+        num_actions = metadata["num_actions"]
+
+        def network(obs, legal):
+            torso = hk.nets.MLP(layers, activate_final=True)(obs)
+            logit = hk.nets.MLP([num_actions])(torso)
+            return rnad._legal_policy(logit, legal)
+
+        self._network = hk.without_apply_rng(hk.transform(network))
+        self._jit_apply = jax.jit(self._apply)
+
+    @classmethod
+    def from_solver(cls, agent):
+        return cls(
+            unflatten_params(flatten_params(agent.params_target)),
+            policy_metadata(agent),
+        )
+
+    def _apply(self, params, obs, legal):
+        pi = self._network.apply(params, obs, legal)
+        return self._finetune.post_process_policy(pi, legal)
+
+    def _state_tensor(self, state):
+        if (
+            self.metadata["state_representation"]
+            == rnad.StateRepresentation.OBSERVATION
+        ):
+            return state.observation_tensor()
+        return state.information_state_tensor()
+
+    def policy_matrix(self, obs, legal) -> np.ndarray:
+        """Action probabilities [B, num_actions] of a batch of state tensors and legal masks.
+
+        The whole batch is one forward pass. Batches are padded to the next power of two, so
+        only a handful of batch shapes are ever compiled.
+        """
+        batch_size = len(obs)
+        padded_size = 1 << (batch_size - 1).bit_length() if batch_size > 1 else 1
+        padded_obs = np.zeros((padded_size, np.shape(obs)[1]), dtype=np.float32)
+        padded_obs[:batch_size] = obs
+        # padding rows get a legal action too, so their policy is well defined
+        padded_legal = np.zeros((padded_size, np.shape(legal)[1]), dtype=np.int8)
+        padded_legal[batch_size:, 0] = 1
+        padded_legal[:batch_size] = legal
+
+        probs = self._jit_apply(self.params, padded_obs, padded_legal)
+        return np.asarray(jax.device_get(probs))[:batch_size]
+
+    def states_policy_matrix(self, states) -> np.ndarray:
+        """policy_matrix of a list of pyspiel states"""
+        obs = np.array(
+            [self._state_tensor(state) for state in states], dtype=np.float32
+        )
+        legal = np.array(
+            [state.legal_actions_mask() for state in states], dtype=np.int8
+        )
+        return self.policy_matrix(obs, legal)
+
+    def action_probabilities(self, state, player_id=None):
+        probs = self.states_policy_matrix([state])[0]
+        legal = state.legal_actions_mask()
+        return {action: probs[action] for action, valid in enumerate(legal) if valid}
+
+
+class SharedPolicy:
+    """Read-only handle to the params of an InferencePolicy, shared across processes.
+
+    The params are copied once into a block of shared memory, and the handle only pickles
+    the block's name and layout, so worker processes map the same params instead of each
+    loading the checkpoint. Where shared memory isn't available the handle carries the
+    arrays themselves. `load` builds the policy once per process and reuses it after that.
+    Every array starts on a 64-byte boundary of the block, so on the CPU backend the
+    policy's params are the shared block itself; on an accelerator each process that calls
+    `load` puts its own copy of the params on its device. The process that created the
+    handle owns the block and releases it with `close`, once no policy loaded from the
+    block is in use.
+    """
+
+    def __init__(self, params, metadata: dict):
+        self.metadata = metadata
+        arrays = flatten_params(params)
+        self._layout = {}
+        offset = 0
+        for key, value in arrays.items():
+            self._layout[key] = (offset, value.shape)
+            offset += -(-value.size // SHARED_ALIGNMENT) * SHARED_ALIGNMENT
+        self._size = offset
+        self._arrays = None
+        self._shm = None
+        self._owner = True
+        try:
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=offset * np.dtype(np.float32).itemsize
+            )
+        except OSError:
+            self._arrays = arrays
+        else:
+            buffer = np.ndarray((offset,), dtype=np.float32, buffer=self._shm.buf)
+            for key, value in arrays.items():
+                start, _ = self._layout[key]
+                buffer[start : start + value.size] = value.ravel()
+        self._policy = None
+
+    @classmethod
+    def from_policy(cls, inference_policy):
+        handle = cls(inference_policy.params, inference_policy.metadata)
+        handle._policy = inference_policy
+        return handle
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shm"] = self._shm.name if self._shm is not None else None
+        state["_owner"] = False
+        state["_policy"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._shm is not None:
+            self._shm = shared_memory.SharedMemory(name=self._shm)
+
+    def _params(self) -> dict:
+        if self._arrays is not None:
+            return unflatten_params(self._arrays)
+        buffer = np.ndarray((self._size,), dtype=np.float32, buffer=self._shm.buf)
+        buffer.flags.writeable = False
+        return unflatten_params(
+            {
+                key: buffer[start : start + int(np.prod(shape))].reshape(shape)
+                for key, (start, shape) in self._layout.items()
+            }
+        )
+
+    def load(self) -> InferencePolicy:
+        if self._policy is None:
+            self._policy = InferencePolicy(self._params(), self.metadata)
+        return self._policy
+
+    def close(self):
+        """Releases the block; it's freed once every process that mapped it has exited"""
+        if self._shm is not None and self._owner:
+            self._shm.close()
+            self._shm.unlink()
+            self._owner = False
+
+
+def sample_actions(probs, uniform) -> np.ndarray:
+    """One action per row of `probs`, by inverse-cdf sampling with `uniform` draws in [0, 1)
+
+    Zero-probability actions are never drawn.
+    """
+    cdf = np.cumsum(probs, axis=-1)
+    u = np.reshape(uniform, (-1, 1)) * cdf[:, -1:]
+    return np.minimum((cdf <= u).sum(axis=-1), probs.shape[1] - 1)
+
+
+def load_policy(path: str) -> InferencePolicy:
+    """Loads a policy for inference from a compact .npz checkpoint or a full solver pickle"""
+    if os.path.splitext(path)[1] == ".npz":
+        return InferencePolicy(*load_policy_checkpoint(path))
+
+    with open(path, "rb") as f:
+        return InferencePolicy.from_solver(cloudpickle.load(f))
+
+
+def find_checkpoint(input_dir: str, training_step: int) -> str:
+    """Path of the checkpoint for `training_step`, preferring the compact format"""
+    for ext in (".npz", ".pickle"):
+        path = os.path.join(input_dir, f"agent_{training_step}{ext}")
+        if os.path.isfile(path):
+            return path
+    raise ValueError(f"Unable to find checkpoint agent_{training_step} in {input_dir}")
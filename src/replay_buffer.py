@@ -0,0 +1,163 @@
+import functools
+
+import numpy as np
+from open_spiel.python.jax import dqn
+
+
+class ArrayReplayBuffer:
+    """Replay buffer of DQN transitions kept in preallocated NumPy columns.
+
+    A drop-in for the list-backed open_spiel ReplayBuffer of dqn.DQN: `add`, `sample` and
+    `len` behave the same (the oldest transition is overwritten once `capacity` are stored,
+    and a sample is drawn without replacement). Info states are stored as `state_dtype`;
+    Liar's Poker info state tensors only hold small integers, so uint8 is lossless. A sample
+    gathers every column with one fancy index, and `extend` writes a batch of transitions
+    column by column. The columns are allocated on the first `add`, so agents that are only
+    evaluated never hold them.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        state_size: int,
+        num_actions: int,
+        state_dtype=np.float32,
+        rng: np.random.Generator | None = None,
+    ):
+        self._capacity = capacity
+        self._state_size = state_size
+        self._num_actions = num_actions
+        self._state_dtype = state_dtype
+        self._rng = rng if rng is not None else np.random.default_rng()
+        self._columns = None
+        self._next_index = 0
+        self._size = 0
+
+    def _allocate(self):
+        capacity = self._capacity
+        self._columns = dqn.Transition(
+            info_state=np.zeros((capacity, self._state_size), dtype=self._state_dtype),
+            action=np.zeros(capacity, dtype=np.int32),
+            reward=np.zeros(capacity, dtype=np.float32),
+            next_info_state=np.zeros(
+                (capacity, self._state_size), dtype=self._state_dtype
+            ),
+            is_final_step=np.zeros(capacity, dtype=np.uint8),
+            legal_actions_mask=np.zeros((capacity, self._num_actions), dtype=np.uint8),
+        )
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        if self._columns is None:
+            return 0
+        return sum(column.nbytes for column in self._columns)
+
+    def summary(self) -> dict:
+        """Size and contents of the buffer at a glance"""
+        summary = {
+            "size": self._size,
+            "capacity": self._capacity,
+            "nbytes": self.nbytes,
+        }
+        if self._size:
+            summary["mean_reward"] = float(self._columns.reward[: self._size].mean())
+            summary["final_step_fraction"] = float(
+                self._columns.is_final_step[: self._size].mean()
+            )
+        return summary
+
+    def add(self, transition: dqn.Transition):
+        self.extend([transition])
+
+    def extend(self, transitions):
+        """Adds a batch of transitions, oldest first"""
+        if not transitions:
+            return
+        # only the newest `capacity` transitions would survive anyway
+        transitions = transitions[-self._capacity :]
+        if self._columns is None:
+            self._allocate()
+        ix = (self._next_index + np.arange(len(transitions))) % self._capacity
+        for column, values in zip(self._columns, zip(*transitions)):
+            column[ix] = values
+        self._next_index = (ix[-1] + 1) % self._capacity
+        self._size = min(self._size + len(transitions), self._capacity)
+
+    def sample_arrays(self, num_samples: int) -> dqn.Transition:
+        """`num_samples` distinct transitions as a Transition of [num_samples, ...] arrays"""
+        if num_samples > self._size:
+            raise ValueError(
+                f"{num_samples} elements could not be sampled from size {self._size}"
+            )
+        ix = self._rng.choice(self._size, num_samples, replace=False)
+        return self._rows(ix)
+
+    def _rows(self, ix) -> dqn.Transition:
+        columns = self._columns
+        return dqn.Transition(
+            info_state=columns.info_state[ix].astype(np.float32),
+            action=columns.action[ix],
+            reward=columns.reward[ix],
+            next_info_state=columns.next_info_state[ix].astype(np.float32),
+            is_final_step=columns.is_final_step[ix].astype(np.float32),
+            legal_actions_mask=columns.legal_actions_mask[ix].astype(np.float32),
+        )
+
+    def sample(self, num_samples: int) -> list:
+        """`num_samples` distinct transitions, as the list dqn.DQN.learn expects"""
+        return [dqn.Transition(*row) for row in zip(*self.sample_arrays(num_samples))]
+
+    def __iter__(self):
+        for ix in range(self._size):
+            yield self._rows(ix)
+
+    def reset(self):
+        self._next_index = 0
+        self._size = 0
+
+
+class ArrayReplayDQN(dqn.DQN):
+    """dqn.DQN with an ArrayReplayBuffer, whose minibatches are sampled as arrays.
+
+    Learns exactly like dqn.DQN.learn, without building the minibatch one transition at a
+    time.
+    """
+
+    def __init__(self, player_id, state_representation_size, num_actions, **kwargs):
+        super().__init__(
+            player_id,
+            state_representation_size,
+            num_actions,
+            replay_buffer_class=functools.partial(
+                ArrayReplayBuffer,
+                state_size=state_representation_size,
+                num_actions=num_actions,
+                state_dtype=np.uint8,
+            ),
+            **kwargs,
+        )
+
+    def learn(self):
+        if (
+            len(self._replay_buffer) < self._batch_size
+            or len(self._replay_buffer) < self._min_buffer_size_to_learn
+        ):
+            return None
+
+        batch = self._replay_buffer.sample_arrays(self._batch_size)
+        actions = np.eye(self._num_actions, dtype=np.float32)[batch.action]
+        self.params_q_network, self._opt_state, loss_val = self._jit_update(
+            self.params_q_network,
+            self.params_target_q_network,
+            self._opt_state,
+            batch.info_state,
+            actions,
+            batch.reward,
+            batch.next_info_state,
+            batch.is_final_step,
+            batch.legal_actions_mask,
+        )
+        return loss_val
@@ -0,0 +1,93 @@
+import contextlib
+import os
+import time
+
+import jax
+
+from training_metrics import RingBuffer
+
+
+class StepProfiler:
+    """Opt-in breakdown of each training step's wall time into named phases.
+
+    Code being profiled wraps each part in `with profiler.phase(name)`; phase times are summed
+    per step and kept for the last `window` steps, next to the total step time. JAX dispatches
+    work asynchronously, so profiled code blocks until the device work of a phase is done,
+    which makes the phases add up to the step time at the cost of some overlap.
+
+    If `trace_start_step` is set, a JAX profiler trace covering `trace_num_steps` steps from
+    that step is written to `trace_dir`, with each phase as a named annotation. It can be
+    opened in TensorBoard's profile plugin or Perfetto.
+    """
+
+    def __init__(
+        self,
+        window: int,
+        trace_dir: str | None = None,
+        trace_start_step: int | None = None,
+        trace_num_steps: int = 10,
+    ):
+        self._window = window
+        self._totals = RingBuffer(window)
+        self._phases = {}  # phase name -> RingBuffer of per-step times
+        self._current = {}
+
+        self.trace_dir = trace_dir
+        self.trace_start_step = trace_start_step
+        self.trace_num_steps = trace_num_steps
+        self._tracing = False
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        with jax.profiler.TraceAnnotation(name):
+            yield
+        self._current[name] = self._current.get(name, 0.0) + time.perf_counter() - start
+
+    @contextlib.contextmanager
+    def step(self, step: int):
+        if step == self.trace_start_step:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            jax.profiler.start_trace(self.trace_dir)
+            self._tracing = True
+
+        self._current = {}
+        start = time.perf_counter()
+        with jax.profiler.StepTraceAnnotation("train", step_num=step):
+            yield
+        self._totals.add(time.perf_counter() - start)
+
+        for name in self._current:
+            if name not in self._phases:
+                self._phases[name] = RingBuffer(self._window)
+        # phases that didn't run this step (eg a periodic param sync) count as zero
+        for name, times in self._phases.items():
+            times.add(self._current.get(name, 0.0))
+
+        if self._tracing and step == self.trace_start_step + self.trace_num_steps - 1:
+            self.close()
+
+    def close(self):
+        if self._tracing:
+            jax.profiler.stop_trace()
+            self._tracing = False
+            print(f"wrote profiler trace to {self.trace_dir}")
+
+    def summary(self) -> dict:
+        """Window statistics of each phase, plus its share of the mean step time"""
+        total = self._totals.stats()
+        summary = {}
+        for name, times in self._phases.items():
+            stats = times.stats()
+            stats["share"] = stats["mean"] / total["mean"] if total["mean"] else None
+            summary[name] = stats
+        summary["step"] = total
+        return summary
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        return "; ".join(
+            f"{name} {stats['mean']:.3f}s ({stats['share']:.0%})"
+            for name, stats in summary.items()
+            if name != "step" and stats["mean"] is not None
+        )
@@ -0,0 +1,221 @@
+import csv
+import dataclasses
+import itertools
+import json
+import multiprocessing as mp
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cloudpickle
+import numpy as np
+from open_spiel.python.algorithms.rnad import rnad
+
+from config_schema import SweepConfig, TrainConfig
+from train import overwrite_internal_config, train
+from utils import dump_config, load_config
+
+# changing these would make the checkpoint's params unusable
+NETWORK_FIELDS = ("policy_network_layers", "state_representation")
+
+RESULT_FIELDS = [
+    "status",
+    "steps",
+    "final_loss",
+    "running_mean_loss",
+    "steps_per_sec",
+    "trajectories_per_sec",
+    "wall_time_sec",
+]
+
+
+def sweep_trials(config: SweepConfig) -> list[dict]:
+    """The RNaDConfig overrides of every run in the sweep"""
+    rnad_fields = {f.name for f in dataclasses.fields(rnad.RNaDConfig)} - {"game_name"}
+    names = list(config.parameters) + list(config.log_uniform)
+    unknown = set(names) - rnad_fields
+    if unknown:
+        raise ValueError(f"not RNaDConfig fields: {sorted(unknown)}")
+    if config.base_checkpoint and set(names) & set(NETWORK_FIELDS):
+        raise ValueError(f"{NETWORK_FIELDS} can't be swept when forking a checkpoint")
+
+    if config.search == "grid":
+        if config.log_uniform:
+            raise ValueError("log_uniform parameters need random search")
+        return [
+            dict(zip(config.parameters, values))
+            for values in itertools.product(*config.parameters.values())
+        ]
+
+    rng = np.random.default_rng(config.seed)
+    trials = []
+    for _ in range(config.num_samples):
+        trial = {
+            name: values[rng.integers(len(values))]
+            for name, values in config.parameters.items()
+        }
+        for name, (low, high) in config.log_uniform.items():
+            trial[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        trials.append(trial)
+    return trials
+
+
+def make_agent(train_config: TrainConfig, base_checkpoint: str | None, overrides):
+    """A new solver with `overrides`, or the base checkpoint re-parameterized with them"""
+    game = train_config.game
+    if base_checkpoint is None:
+        rnad_config = {**train_config.train.rnad.model_dump(), **overrides}
+        agent = rnad.RNaDSolver(
+            rnad.RNaDConfig(
+                game_name="python_liars_poker(num_digits={},hand_length={},players={})".format(
+                    game.num_digits, game.hand_length, game.num_players
+                ),
+                **rnad_config,
+            )
+        )
+        return agent, -1
+
+    m = re.search(r"agent_(\d+)\.pickle", base_checkpoint)
+    if not m:
+        raise RuntimeError(f"Unable to parse step from filename {base_checkpoint}")
+    with open(base_checkpoint, "rb") as f:
+        agent = cloudpickle.load(f)
+
+    # keep the checkpoint's own settings for everything that isn't swept
+    rnad_config = {
+        f.name: getattr(agent.config, f.name)
+        for f in dataclasses.fields(agent.config)
+        if f.name != "game_name"
+    }
+    rnad_config.update(overrides)
+    overwrite_internal_config(
+        agent,
+        rnad_config,
+        list(overrides),
+        game.num_digits,
+        game.hand_length,
+        game.num_players,
+    )
+    return agent, int(m.group(1))
+
+
+def metrics_row(run_dir: str, batch_size: int) -> dict:
+    """Summary of a finished run from its metrics.jsonl"""
+    with open(os.path.join(run_dir, "metrics.jsonl")) as f:
+        records = [json.loads(line) for line in f]
+    last = records[-1]
+    # weight each interval's throughput by its number of steps
+    total_steps = sum(r["interval_steps"] for r in records)
+    steps_per_sec = total_steps / sum(
+        r["interval_steps"] / r["steps_per_sec"] for r in records if r["steps_per_sec"]
+    )
+    return {
+        "steps": last["step"],
+        "final_loss": last["loss"]["mean"],
+        "running_mean_loss": last["running_mean_loss"],
+        "steps_per_sec": steps_per_sec,
+        "trajectories_per_sec": steps_per_sec * batch_size,
+    }
+
+
+_cpu_slots = None
+
+
+def _init_worker(cpu_slots):
+    global _cpu_slots
+    _cpu_slots = cpu_slots
+
+
+def _run_trial(run_name, run_config, base_checkpoint, overrides):
+    # pin this run to a free set of cores before jax starts its thread pools; workers are
+    # fresh processes, so XLA sizes its pools to the pinned cores
+    cores = _cpu_slots.get()
+    start = time.time()
+    run_dir = os.path.join(run_config.io.save_dir, run_config.io.run_id)
+    try:
+        os.sched_setaffinity(0, cores)
+        os.makedirs(run_dir)
+        dump_config(run_config, run_dir)
+        with open(os.path.join(run_dir, "overrides.json"), "w") as f:
+            json.dump(overrides, f, indent=2)
+
+        agent, last_step = make_agent(run_config, base_checkpoint, overrides)
+        train(run_config, run_dir, agent=agent, last_step=last_step)
+        row = {"status": "done", **metrics_row(run_dir, agent.config.batch_size)}
+    except Exception:
+        traceback.print_exc()
+        row = {"status": "failed"}
+    finally:
+        _cpu_slots.put(cores)
+    return {"run": run_name, **overrides, **row, "wall_time_sec": time.time() - start}
+
+
+def run_sweep(config: SweepConfig) -> list[dict]:
+    base_config = load_config(config.base_config)
+    trials = sweep_trials(config)
+    names = list(config.parameters) + list(config.log_uniform)
+
+    cpus = sorted(os.sched_getaffinity(0))
+    if config.num_workers * config.cpus_per_worker > len(cpus):
+        raise ValueError(
+            f"{config.num_workers} workers x {config.cpus_per_worker} cpus "
+            f"don't fit on {len(cpus)} available cores"
+        )
+
+    sweep_dir = os.path.join(base_config.io.save_dir, config.sweep_id)
+    if os.path.isdir(sweep_dir):
+        raise IOError("sweep_id must be unique to avoid accidental overwriting of runs")
+    os.makedirs(sweep_dir)
+    dump_config(config, sweep_dir)
+
+    # one set of cores per worker, handed out to whichever run the worker picks up next
+    ctx = mp.get_context("spawn")
+    cpu_slots = ctx.Queue()
+    for worker in range(config.num_workers):
+        n = config.cpus_per_worker
+        cpu_slots.put(cpus[worker * n : (worker + 1) * n])
+
+    results = []
+    results_path = os.path.join(sweep_dir, "results.csv")
+    with (
+        open(results_path, "w", newline="") as f,
+        ProcessPoolExecutor(
+            config.num_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(cpu_slots,),
+            max_tasks_per_child=1,
+        ) as pool,
+    ):
+        writer = csv.DictWriter(f, fieldnames=["run", *names, *RESULT_FIELDS])
+        writer.writeheader()
+
+        futures = []
+        for ix, overrides in enumerate(trials):
+            run_name = f"run_{ix:03d}"
+            run_config = base_config.model_copy(deep=True)
+            run_config.io.run_id = os.path.join(config.sweep_id, run_name)
+            run_config.io.load_checkpoint = None
+            if config.training_steps is not None:
+                run_config.train.training_steps = config.training_steps
+            futures.append(
+                pool.submit(
+                    _run_trial, run_name, run_config, config.base_checkpoint, overrides
+                )
+            )
+
+        for future in as_completed(futures):
+            row = future.result()
+            print(f"{row['run']} {row['status']}: {row}")
+            writer.writerow(row)
+            f.flush()
+            results.append(row)
+    print(f"results written to {results_path}")
+    return results
+
+
+if __name__ == "__main__":
+    config = load_config("../config_sweep.yaml", config_type="sweep")
+    run_sweep(config)
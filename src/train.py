@@ -1,29 +1,23 @@
 import os
 import re
 import time
+from contextlib import ExitStack, nullcontext
 
 import cloudpickle
-import jax
-import numpy as np
 from open_spiel.python.algorithms.rnad import rnad
 from open_spiel.python.algorithms.rnad.rnad import RNaDConfig
 from tqdm import trange
 
+from actor_learner import ActorLearner, SolverRollout, VectorRollout
+from checkpoint_manager import CheckpointManager
+from checkpoint_writer import CheckpointWriter
+from compilation_cache import enable_compilation_cache
 from config_schema import TrainConfig
+from step_profiler import StepProfiler
+from training_metrics import MetricsRecorder
 from utils import dump_config, load_config
 
 
-def checkpoint(agent, save_dir, training_step):
-    if not os.path.isdir(save_dir):
-        os.mkdir(save_dir)
-
-    jax.clear_caches()
-
-    output_file = save_dir + f"/agent_{training_step}.pickle"
-    with open(output_file, "wb") as f:
-        cloudpickle.dump(agent, f)
-
-
 def overwrite_internal_config(
     agent, config, param_list, num_digits, hand_length, num_players
 ):
@@ -47,11 +41,43 @@ def overwrite_internal_config(
         print(f"set {param} in optimizer to", agent_state["config"][param])
 
 
-def train(config: TrainConfig, save_dir: str):
+def train(config: TrainConfig, save_dir: str, agent=None, last_step: int = -1):
+    """Trains `agent`, or the agent described by `config` if none is given.
+
+    Steps are numbered from `last_step` + 1, so a loaded agent continues its own numbering.
+    """
+
+    # reuse the programs compiled by earlier runs with the same game and network
+    compilation_cache = enable_compilation_cache(
+        config.compilation_cache,
+        {
+            "script": "train",
+            "game": config.game.model_dump(),
+            "rnad": config.train.rnad.model_dump(),
+        },
+    )
+
+    # indexes the run's checkpoints and deletes the ones the retention policy evicts
+    checkpoints = CheckpointManager(
+        save_dir,
+        keep_last=config.io.keep_last_checkpoints,
+        milestone_steps=(
+            config.io.milestone_every * config.train.checkpoint_frequency
+            if config.io.milestone_every
+            else None
+        ),
+    )
 
-    # set up agent
+    # set up agent, unless one was passed in
     prev_checkpoint = config.io.load_checkpoint
-    if prev_checkpoint:
+    latest = None
+    if agent is None and not prev_checkpoint and config.io.resume:
+        latest = checkpoints.load_latest()
+
+    if latest is not None:
+        agent, last_step = latest
+        print(f"resuming from {checkpoints.path(last_step)}")
+    elif agent is None and prev_checkpoint:
         m = re.search(r"agent_(\d+)\.pickle", prev_checkpoint)
         if m:
             last_step = int(m.group(1))
@@ -60,7 +86,7 @@ def train(config: TrainConfig, save_dir: str):
 
         with open(os.path.join(save_dir, prev_checkpoint), "rb") as f:
             agent = cloudpickle.load(f)
-    else:
+    elif agent is None:
         last_step = -1
         rnad_config = config.train.rnad.model_dump()
 
@@ -76,35 +102,91 @@ def train(config: TrainConfig, save_dir: str):
             )
         )
 
-    losses = []
-    step_times = []
-
-    # training loop
-    for step in trange(last_step + 1, last_step + config.train.training_steps + 1):
-        start_time = time.time()
-        logs = agent.step()
-        step_end = time.time()
-
-        losses.append(logs["loss"])
-        step_times.append(step_end - start_time)
-
-        if (
-            step % config.train.checkpoint_frequency
-            == config.train.checkpoint_frequency - 1
-        ):
-            mean_losses = np.mean(losses[-config.train.checkpoint_frequency :])
-            mean_step_time = np.mean(step_times[-config.train.checkpoint_frequency :])
-            print(
-                f"Step: {step}; "
-                f"Avg Loss: {mean_losses:.2f}; "
-                f"Avg Step Time (sec): {mean_step_time:.2f}; "
-                f"Est. Steps / Day: {int(60 * 60 * 24 / mean_step_time)}"
-            )
-            checkpoint(agent, save_dir, step)
+    # per-interval metrics are appended to metrics.jsonl in the run directory
+    metrics = MetricsRecorder(
+        os.path.join(save_dir, "metrics.jsonl"),
+        window=config.train.report_frequency,
+        batch_size=config.train.rnad.batch_size,
+    )
 
-    # Save final checkpoint
-    print("Step: {}".format(step))
-    checkpoint(agent, save_dir, step)
+    with ExitStack() as stack:
+        # checkpoints are snapshotted here and written to disk by a background thread
+        writer = stack.enter_context(
+            CheckpointWriter(save_dir, on_written=checkpoints.add)
+        )
+
+        profiler = None
+        if config.train.profile:
+            profiler = StepProfiler(
+                window=config.train.report_frequency,
+                trace_dir=os.path.join(save_dir, "trace"),
+                trace_start_step=config.train.trace_start_step,
+                trace_num_steps=config.train.trace_num_steps,
+            )
+            stack.callback(profiler.close)
+
+        # with actors, trajectories are generated in separate processes and each step
+        # only runs the learner update; otherwise agent.step() does both in turn
+        if config.train.num_actors > 0:
+            train_step = stack.enter_context(
+                ActorLearner(
+                    agent,
+                    config.train.num_actors,
+                    param_sync_frequency=config.train.param_sync_frequency,
+                    max_queued_trajectories=config.train.max_queued_trajectories,
+                    vectorized_rollouts=config.train.vectorized_rollouts,
+                    profiler=profiler,
+                )
+            ).step
+        elif config.train.vectorized_rollouts:
+            train_step = VectorRollout(agent, profiler).step
+        elif profiler:
+            train_step = SolverRollout(agent, profiler).step
+        else:
+            train_step = agent.step
+
+        # training loop
+        for step in trange(last_step + 1, last_step + config.train.training_steps + 1):
+            start_time = time.time()
+            with profiler.step(step) if profiler else nullcontext():
+                logs = train_step()
+            step_end = time.time()
+
+            metrics.add(logs["loss"], step_end - start_time)
+            if compilation_cache and step == last_step + 1:
+                # the first step has compiled (or loaded) everything training needs
+                compilation_cache.report()
+
+            if (
+                step % config.train.report_frequency
+                == config.train.report_frequency - 1
+            ):
+                metrics.write(
+                    step, {"phases": profiler.summary()} if profiler else None
+                )
+
+            if (
+                step % config.train.checkpoint_frequency
+                == config.train.checkpoint_frequency - 1
+            ):
+                summary = metrics.summary()
+                mean_step_time = summary["step_time"]["mean"]
+                print(
+                    f"Step: {step}; "
+                    f"Avg Loss: {summary['loss']['mean']:.2f}; "
+                    f"Avg Step Time (sec): {mean_step_time:.2f}; "
+                    f"p95 Step Time (sec): {summary['step_time']['p95']:.2f}; "
+                    f"Est. Steps / Day: {int(60 * 60 * 24 / mean_step_time)}"
+                )
+                if profiler:
+                    print(f"Step phases: {profiler.format_summary()}")
+                writer.submit(agent, step)
+
+        # Save final checkpoint
+        print("Step: {}".format(step))
+        if metrics.interval_steps:
+            metrics.write(step, {"phases": profiler.summary()} if profiler else None)
+        writer.submit(agent, step)
 
 
 if __name__ == "__main__":
@@ -116,7 +198,7 @@ if __name__ == "__main__":
 
     if not os.path.isdir(save_dir):
         os.mkdir(save_dir)
-    elif not config.io.load_checkpoint:
+    elif not (config.io.load_checkpoint or config.io.resume):
         raise IOError(
             "config.io.run_id must be unique to avoid accidental overwriting of checkpoints"
         )
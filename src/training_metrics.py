@@ -0,0 +1,96 @@
+import json
+import time
+
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-size buffer holding the most recent `size` values"""
+
+    def __init__(self, size: int):
+        self._values = np.zeros(size, dtype=np.float64)
+        self._index = 0
+        self._count = 0
+
+    def add(self, value):
+        self._values[self._index] = value
+        self._index = (self._index + 1) % len(self._values)
+        self._count = min(self._count + 1, len(self._values))
+
+    def values(self):
+        return self._values[: self._count]
+
+    def stats(self) -> dict:
+        values = self.values()
+        if len(values) == 0:
+            return {"mean": None, "p50": None, "p95": None, "max": None}
+        p50, p95 = np.percentile(values, [50, 95])
+        return {
+            "mean": float(values.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "max": float(values.max()),
+        }
+
+
+class MetricsRecorder:
+    """Streaming training metrics with memory bounded by `window`, regardless of run length.
+
+    Loss and step time are kept in ring buffers of the last `window` steps. Each call to
+    `write` appends one JSON line to `log_path` with the window statistics (mean, p50, p95,
+    max), the running mean of the loss since the start of the run, and the throughput
+    measured over the wall-clock time since the previous line.
+    """
+
+    def __init__(self, log_path: str, window: int, batch_size: int):
+        self.log_path = log_path
+        self.batch_size = batch_size
+
+        self._losses = RingBuffer(window)
+        self._step_times = RingBuffer(window)
+        self._total_loss = 0.0
+        self._total_steps = 0
+
+        self._interval_steps = 0
+        self._interval_start = time.time()
+
+    def add(self, loss, step_time):
+        loss = float(loss)
+        self._losses.add(loss)
+        self._step_times.add(step_time)
+        self._total_loss += loss
+        self._total_steps += 1
+        self._interval_steps += 1
+
+    @property
+    def interval_steps(self) -> int:
+        # steps recorded since the last line was written
+        return self._interval_steps
+
+    def summary(self) -> dict:
+        return {
+            "loss": self._losses.stats(),
+            "step_time": self._step_times.stats(),
+            "running_mean_loss": self._total_loss / max(self._total_steps, 1),
+        }
+
+    def write(self, step: int, extra: dict | None = None) -> dict:
+        now = time.time()
+        elapsed = now - self._interval_start
+        steps_per_sec = self._interval_steps / elapsed if elapsed > 0 else 0.0
+
+        record = {
+            "step": step,
+            "timestamp": now,
+            "interval_steps": self._interval_steps,
+            "steps_per_sec": steps_per_sec,
+            "trajectories_per_sec": steps_per_sec * self.batch_size,
+            **self.summary(),
+            **(extra or {}),
+        }
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+        self._interval_steps = 0
+        self._interval_start = now
+        return record
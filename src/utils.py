@@ -5,26 +5,43 @@ import yaml
 from pydantic import BaseModel
 
 from config_schema import (
+    BenchmarkConfig,
     BestResponseConfig,
+    BestResponseSweepConfig,
     PlayAgentsConfig,
     PlayInteractiveConfig,
+    SweepConfig,
     TrainConfig,
 )
 
 
 def load_config(
     file_path: str = "../config.yaml", config_type: str = "train"
-) -> BestResponseConfig | PlayAgentsConfig | PlayInteractiveConfig | TrainConfig:
+) -> (
+    BenchmarkConfig
+    | BestResponseConfig
+    | BestResponseSweepConfig
+    | PlayAgentsConfig
+    | PlayInteractiveConfig
+    | SweepConfig
+    | TrainConfig
+):
     with open(file_path, "r") as f:
         raw_dict = yaml.safe_load(f)
         if config_type == "train":
             return TrainConfig(**raw_dict)
         if config_type == "best_response":
             return BestResponseConfig(**raw_dict)
+        if config_type == "best_response_sweep":
+            return BestResponseSweepConfig(**raw_dict)
         if config_type == "play_interactive":
             return PlayInteractiveConfig(**raw_dict)
         if config_type == "play_agents":
             return PlayAgentsConfig(**raw_dict)
+        if config_type == "benchmark":
+            return BenchmarkConfig(**raw_dict)
+        if config_type == "sweep":
+            return SweepConfig(**raw_dict)
         raise ValueError(f"config type {config_type} not recognized")
 
 
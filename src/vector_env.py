@@ -0,0 +1,272 @@
+import copy
+
+import numpy as np
+
+# action encoding of python_liars_poker: 0 is a challenge, bid k (0-based) is action k + 1
+CHALLENGE_ACTION = 0
+BID_ACTION_OFFSET = 1
+
+# python_liars_poker deals from this deck, truncated to num_digits
+FULL_DECK = [1, 2, 3, 4, 5, 6, 7, 8, 9, 0]
+
+# python_liars_poker reports the same number of distinct actions for every game size,
+# sized for its default 2-player 10x10 game; masks and policies use this width
+NUM_DISTINCT_ACTIONS = 10 * 10 * 2 + BID_ACTION_OFFSET
+
+TERMINAL_PLAYER = -4  # pyspiel.PlayerId.TERMINAL
+
+
+class VectorLiarsPoker:
+    """`num_games` games of python_liars_poker stepped together as NumPy arrays.
+
+    Follows the rules of the pyspiel game exactly: games start right after the deal, bids
+    and challenges are applied for all games in one call, and legal action masks,
+    information state tensors and returns are produced for the whole batch with the same
+    encodings as state.legal_actions_mask(), state.information_state_tensor() and
+    state.returns(). Finished games ignore further actions.
+    """
+
+    def __init__(
+        self,
+        num_games: int,
+        num_digits: int,
+        hand_length: int,
+        num_players: int,
+        num_actions: int = NUM_DISTINCT_ACTIONS,
+        rng: np.random.Generator | None = None,
+    ):
+        self.num_games = num_games
+        self.num_digits = num_digits
+        self.hand_length = hand_length
+        self.num_players = num_players
+        self.num_actions = num_actions
+        self.max_bid = hand_length * num_digits * num_players
+        self.deck = np.array(FULL_DECK[:num_digits], dtype=np.int8)
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        # information state tensor layout, see LiarsPokerObserver
+        self._hand_offset = num_players
+        self._rebid_offset = self._hand_offset + hand_length
+        self._counts_offset = self._rebid_offset + 1
+        self._bid_offset = self._counts_offset + 1
+        self._challenge_offset = self._bid_offset + self.max_bid * num_players
+        self.information_state_tensor_size = (
+            self._challenge_offset + self.max_bid * num_players
+        )
+
+        self.reset()
+
+    @classmethod
+    def from_game(cls, game, num_games: int, rng: np.random.Generator | None = None):
+        return cls(
+            num_games,
+            game.num_digits,
+            game.hand_length,
+            game.num_players(),
+            num_actions=game.num_distinct_actions(),
+            rng=rng,
+        )
+
+    def reset(self, hands: np.ndarray | None = None):
+        """Starts new games, with `hands` of shape [B, players, hand_length] or a random deal"""
+        shape = (self.num_games, self.num_players, self.hand_length)
+        if hands is None:
+            hands = self.rng.choice(self.deck, size=shape)
+        self.hands = np.asarray(hands, dtype=np.int8).reshape(shape)
+
+        self.bid_history = np.zeros(
+            (self.num_games, self.max_bid, self.num_players), dtype=bool
+        )
+        self.challenge_history = np.zeros_like(self.bid_history)
+        # dealing hands round-robin leaves player 0 to act first
+        self._current_player = np.zeros(self.num_games, dtype=np.int64)
+        self.current_action = np.full(self.num_games, -1, dtype=np.int64)
+        self.bid_originator = np.full(self.num_games, -1, dtype=np.int64)
+        self.num_challenges = np.zeros(self.num_games, dtype=np.int64)
+        self.is_rebid = np.zeros(self.num_games, dtype=bool)
+        self.winner = np.full(self.num_games, -1, dtype=np.int64)
+        self.loser = np.full(self.num_games, -1, dtype=np.int64)
+
+    def take(self, indices) -> "VectorLiarsPoker":
+        """A new batch with copies of the games at `indices`, which may repeat"""
+        games = copy.copy(self)
+        games.num_games = len(indices)
+        for name in (
+            "hands",
+            "bid_history",
+            "challenge_history",
+            "_current_player",
+            "current_action",
+            "bid_originator",
+            "num_challenges",
+            "is_rebid",
+            "winner",
+            "loser",
+        ):
+            setattr(games, name, getattr(self, name)[indices])
+        return games
+
+    def is_terminal(self) -> np.ndarray:
+        return (self.winner >= 0) | (self.loser >= 0)
+
+    def current_player(self) -> np.ndarray:
+        return np.where(self.is_terminal(), TERMINAL_PLAYER, self._current_player)
+
+    def legal_actions_mask(self) -> np.ndarray:
+        active = ~self.is_terminal()
+        can_challenge = active & (self.current_action != -1)
+        rebid_possible = ~self.is_rebid & (self.num_challenges == self.num_players - 1)
+        can_bid = active & (
+            (self._current_player != self.bid_originator) | rebid_possible
+        )
+        lowest_bid = np.maximum(BID_ACTION_OFFSET, self.current_action + 1)
+
+        actions = np.arange(self.num_actions)
+        mask = (
+            can_bid[:, None]
+            & (actions[None, :] >= lowest_bid[:, None])
+            & (actions[None, :] <= self.max_bid)
+        )
+        mask[:, CHALLENGE_ACTION] = can_challenge
+        return mask.astype(np.int8)
+
+    def information_state_tensor(self, player: np.ndarray | None = None) -> np.ndarray:
+        """Information state tensors [B, size] of `player` (default: the player to act)"""
+        if player is None:
+            player = self._current_player
+        player = np.broadcast_to(player, (self.num_games,))
+        games = np.arange(self.num_games)
+
+        tensor = np.zeros(
+            (self.num_games, self.information_state_tensor_size), dtype=np.float32
+        )
+        tensor[games, player] = 1
+        tensor[:, self._hand_offset : self._rebid_offset] = self.hands[games, player]
+        tensor[:, self._rebid_offset] = self.is_rebid
+        tensor[:, self._counts_offset] = self.is_terminal()
+        tensor[:, self._bid_offset : self._challenge_offset] = self.bid_history.reshape(
+            self.num_games, -1
+        )
+        tensor[:, self._challenge_offset :] = self.challenge_history.reshape(
+            self.num_games, -1
+        )
+        return tensor
+
+    def returns(self) -> np.ndarray:
+        won = self.winner >= 0
+        lost = self.loser >= 0
+        bidder_reward = np.where(won, self.num_players - 1.0, 0.0)
+        bidder_reward = np.where(lost, -(self.num_players - 1.0), bidder_reward)
+        others_reward = np.where(won, -1.0, 0.0)
+        others_reward = np.where(lost, 1.0, others_reward)
+
+        is_bidder = np.arange(self.num_players)[None, :] == self.bid_originator[:, None]
+        return np.where(is_bidder, bidder_reward[:, None], others_reward[:, None])
+
+    def step(self, actions: np.ndarray):
+        """Applies one action per game; the entries for finished games are ignored"""
+        actions = np.asarray(actions, dtype=np.int64)
+        active = ~self.is_terminal()
+        games = np.arange(self.num_games)
+
+        legal = self.legal_actions_mask()[games, actions].astype(bool)
+        if not np.all(legal | ~active):
+            raise ValueError(
+                f"illegal actions for games {np.flatnonzero(active & ~legal)}"
+            )
+
+        player = self._current_player
+        challenge = active & (actions == CHALLENGE_ACTION)
+        bid = active & (actions != CHALLENGE_ACTION)
+
+        # challenges
+        ix = np.flatnonzero(challenge)
+        self.challenge_history[
+            ix, self.current_action[ix] - BID_ACTION_OFFSET, player[ix]
+        ] = True
+        self.num_challenges[ix] += 1
+        counts = challenge & (
+            (~self.is_rebid & (self.num_challenges == self.num_players))
+            | (self.is_rebid & (self.num_challenges == self.num_players - 1))
+        )
+
+        # bids
+        ix = np.flatnonzero(bid)
+        self.current_action[ix] = actions[ix]
+        self.is_rebid[ix] = player[ix] == self.bid_originator[ix]
+        self.bid_originator[ix] = player[ix]
+        self.bid_history[ix, actions[ix] - BID_ACTION_OFFSET, player[ix]] = True
+        self.num_challenges[ix] = 0
+
+        self._count(np.flatnonzero(counts))
+        self._current_player = np.where(active, (player + 1) % self.num_players, player)
+
+    def _count(self, ix):
+        # decode the standing bid into (count, number) and check it against all hands
+        bid = self.current_action[ix] - BID_ACTION_OFFSET
+        number = bid % self.num_digits + 1
+        count = bid // self.num_digits + 1
+        matches = (self.hands[ix] == number[:, None, None]).sum(axis=(1, 2))
+
+        won = matches >= count
+        self.winner[ix[won]] = self.bid_originator[ix[won]]
+        self.loser[ix[~won]] = self.bid_originator[ix[~won]]
+
+
+if __name__ == "__main__":
+    # replays random games through both implementations and checks the encodings match
+    import pyspiel
+    from open_spiel.python import games  # pylint: disable=unused-import
+
+    rng = np.random.default_rng(0)
+    for num_digits, hand_length, num_players in [(3, 3, 2), (3, 3, 3), (4, 2, 4)]:
+        game = pyspiel.load_game(
+            "python_liars_poker",
+            {
+                "players": num_players,
+                "num_digits": num_digits,
+                "hand_length": hand_length,
+            },
+        )
+        env = VectorLiarsPoker.from_game(game, num_games=64, rng=rng)
+        states = []
+        for b in range(env.num_games):
+            state = game.new_initial_state()
+            for ix in range(hand_length):
+                for p in range(num_players):
+                    state.apply_action(int(env.hands[b, p, ix]))
+            states.append(state)
+
+        while not all(s.is_terminal() for s in states):
+            mask = env.legal_actions_mask()
+            tensor = env.information_state_tensor()
+            for b, state in enumerate(states):
+                assert state.is_terminal() == env.is_terminal()[b]
+                assert np.array_equal(state.returns(), env.returns()[b])
+                if state.is_terminal():
+                    continue
+                assert np.array_equal(state.legal_actions_mask(), mask[b])
+                assert np.array_equal(state.information_state_tensor(), tensor[b])
+
+            actions = np.array(
+                [
+                    0 if s.is_terminal() else rng.choice(s.legal_actions())
+                    for s in states
+                ]
+            )
+            for state, action in zip(states, actions):
+                if not state.is_terminal():
+                    state.apply_action(int(action))
+            env.step(actions)
+
+        for b, state in enumerate(states):
+            for p in range(num_players):
+                assert np.array_equal(
+                    state.information_state_tensor(p),
+                    env.information_state_tensor(np.full(env.num_games, p))[b],
+                )
+            assert np.array_equal(state.returns(), env.returns()[b])
+        print(
+            f"{num_players} players, {num_digits} digits, hand length {hand_length}: "
+            f"{env.num_games} games match pyspiel"
+        )